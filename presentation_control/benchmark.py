@@ -0,0 +1,240 @@
+"""Offline benchmark: replay a video (or synthetic frames) through the frame pipeline.
+
+Runs the same stages as MainApp -- flip, hand detection, gesture handling,
+drawing, slide/webcam compositing, annotation saving -- without a camera,
+a MySQL server or a display, and reports throughput plus per-stage
+latency percentiles (see PerfMonitor).
+
+    python benchmark.py --video recording.mp4
+    python benchmark.py --frames 300 --json results.json
+"""
+import warnings
+warnings.filterwarnings("ignore", category=UserWarning, module="google.protobuf")
+import argparse
+import json
+import logging
+import math
+import sys
+import time
+import cv2
+import numpy as np
+from hand_detector import HandDetector
+from detector_process import ProcessHandDetector
+from gesture_control import GestureController
+from drawing_utils import DrawingCanvas
+from compositing import SlideCompositor, compose_webcam, scaled_slide_background
+from perf_monitor import PerfMonitor
+from pipeline import BufferPool
+
+class InMemoryDatabase:
+    """Stand-in for Database that keeps slides and annotations in dicts."""
+    def __init__(self):
+        self.connection = None
+        self.annotations = {}  # (slide_id, user_id) -> [annotation dict, ...]
+        self.slides = {}       # slide_set_id -> [(slide_id, file_path, order_index), ...]
+
+    def add_slide(self, slide_set_id, file_path, order_index):
+        slides = self.slides.setdefault(slide_set_id, [])
+        slides.append((sum(len(s) for s in self.slides.values()) + 1, file_path, order_index))
+        return True
+
+    def get_slides(self, slide_set_id):
+        return sorted(self.slides.get(slide_set_id, []), key=lambda s: s[2])
+
+    def save_annotation(self, slide_id, user_id, data):
+        # Round-trip through JSON like the real table does
+        if isinstance(data, dict):
+            data = json.dumps(data)
+        self.annotations.setdefault((slide_id, user_id), []).append(data)
+        return True
+
+    def save_annotations(self, slide_id, user_id, annotations):
+        rows = [json.dumps(data) if isinstance(data, dict) else data for data in annotations]
+        self.annotations.setdefault((slide_id, user_id), []).extend(rows)
+        return True
+
+    def load_annotations(self, slide_id, user_id):
+        return [json.loads(data) for data in self.annotations.get((slide_id, user_id), [])]
+
+    def close(self):
+        pass
+
+def synthetic_frames(count, width, height):
+    """Yield `count` BGR frames with some texture and motion (no hands in them)."""
+    yy, xx = np.mgrid[0:height, 0:width]
+    background = np.dstack([(xx * 255 // width), (yy * 255 // height), np.full_like(xx, 96)]).astype(np.uint8)
+    for i in range(count):
+        frame = background.copy()
+        cx = int(width / 2 + width / 3 * math.sin(i / 15.0))
+        cy = int(height / 2 + height / 4 * math.cos(i / 10.0))
+        cv2.circle(frame, (cx, cy), height // 8, (90, 140, 200), -1)
+        yield frame
+
+def video_frames(path, count, width, height):
+    """Yield up to `count` frames from a video file (looping), resized to width x height."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        logging.error(f"Cannot open video: {path}")
+        return
+    produced = 0
+    try:
+        while produced < count:
+            success, frame = cap.read()
+            if not success:
+                if produced == 0:
+                    logging.error(f"No frames in video: {path}")
+                    return
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Loop short recordings
+                continue
+            if frame.shape[1] != width or frame.shape[0] != height:
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            produced += 1
+            yield frame
+    finally:
+        cap.release()
+
+def synthetic_fingertip(i, width, height):
+    """Index fingertip position used when the detector finds no hand (keeps the drawing path busy)."""
+    return (width / 2 + width / 4 * math.sin(i / 20.0), height / 2 + height / 4 * math.sin(i / 13.0))
+
+def run_benchmark(args):
+    perf = PerfMonitor(window=max(args.frames, 1))
+    db = InMemoryDatabase()
+    db.add_slide(1, "benchmark_slide", 0)
+    slide_id = db.get_slides(1)[0][0]
+    user_id = 1
+
+    inference_size = (args.inference_width, int(round(args.inference_width * args.height / args.width)))
+    detector_class = ProcessHandDetector if args.detector == 'process' else HandDetector
+    detector = detector_class(min_detection_confidence=0.8, max_hands=1, inference_size=inference_size,
+                              roi_tracking=args.roi, rgb_input=True)
+    gesture_controller = GestureController()
+    canvas = DrawingCanvas(slide_width=1920, slide_height=1080, webcam_width=args.width, webcam_height=args.height,
+                           display_resolution=not args.full_res_annotations, webcam_rgb=True)
+    slide = np.full((1080, 1920, 3), 235, dtype=np.uint8)
+    cv2.putText(slide, "Benchmark slide", (100, 200), cv2.FONT_HERSHEY_SIMPLEX, 4, (40, 40, 40), 8)
+    slide_compositor = SlideCompositor(opacity=args.opacity)
+    display_size = tuple(int(v) for v in args.display_size.lower().split('x')) if args.display_size else None
+    slide_background = scaled_slide_background(slide, display_size, args.blackboard)
+    if canvas.display_resolution and display_size:
+        canvas.set_slide_render_size(*display_size)
+    landmarks = np.zeros((21, 3), dtype=np.float32)
+    flip_pool = BufferPool("flip")
+    webcam_display_pool = BufferPool("webcam_display")
+    slide_display_pool = BufferPool("slide_display")
+
+    if args.video:
+        frames = video_frames(args.video, args.frames, args.width, args.height)
+    else:
+        frames = synthetic_frames(args.frames, args.width, args.height)
+
+    frame_count = 0
+    hands_found = 0
+    start_time = time.time()
+    try:
+        for i, frame in enumerate(frames):
+            capture_time = time.time()
+
+            stage_start = time.time()
+            flipped = flip_pool.acquire(frame.shape)
+            img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=flipped) # As MainApp.mirror_to_rgb
+            img = cv2.flip(img, 1, dst=img)
+            perf.record_since('flip', stage_start)
+
+            stage_start = time.time()
+            img = detector.find_hands(img, draw=True)
+            found = detector.find_landmarks(img, out=landmarks)
+            perf.record_since('inference', stage_start)
+
+            stage_start = time.time()
+            if found is not None:
+                hands_found += 1
+                fingers = detector.fingers_up(found)
+                x_raw, y_raw = found[8, 0], found[8, 1]
+            else:
+                fingers = [0, 1, 0, 0, 0]
+                x_raw, y_raw = synthetic_fingertip(i, args.width, args.height)
+            gesture_controller.detect_mode(fingers)
+            x_norm = min(max(int(x_raw * 800 / args.width), 0), 799)
+            y_norm = min(max(int(y_raw * 600 / args.height), 0), 599)
+            if i % 60 < 45:  # Strokes with pauses in between, like real use
+                canvas.draw(x_norm, y_norm, mode="pen")
+                canvas.draw_on_webcam(x_norm, y_norm, mode="pen")
+            else:
+                canvas.reset_points(mode="pen")
+            perf.record_since('gesture', stage_start)
+
+            stage_start = time.time()
+            slide_display = slide_display_pool.acquire(slide_background.shape)
+            slide_compositor.compose(slide_background, canvas.get_slide_layers(), canvas.take_slide_dirty(),
+                                     rgb_dst=slide_display) # RGB copy to present, as MainApp.composite_frame
+            slide_display_pool.release(slide_display)
+            perf.record_since('slide_composite', stage_start)
+
+            stage_start = time.time()
+            webcam_display = webcam_display_pool.acquire(img.shape)
+            compose_webcam(img, canvas.get_webcam_layers(), args.opacity, dst=webcam_display)
+            perf.record_since('webcam_composite', stage_start)
+            flip_pool.release(flipped)
+            webcam_display_pool.release(webcam_display) # Shown and replaced at once, nothing to keep on screen
+
+            perf.record_since('end_to_end', capture_time)
+            perf.frame_presented()
+            frame_count += 1
+
+        # Saving happens on slide change / exit in the app
+        stage_start = time.time()
+        db.save_annotations(slide_id, user_id, canvas.current_annotations)
+        perf.record_since('annotation_save', stage_start)
+        saved = len(canvas.current_annotations)
+    finally:
+        detector.close()
+
+    elapsed = time.time() - start_time
+    summary = perf.summary()
+    summary.pop('fps', None)
+    return {
+        'frames': frame_count,
+        'hands_found': hands_found,
+        'annotations_saved': saved,
+        'elapsed_s': elapsed,
+        'throughput_fps': frame_count / elapsed if elapsed > 0 else 0.0,
+        'stages_ms': summary,
+    }
+
+def print_report(results):
+    print(f"Frames: {results['frames']} in {results['elapsed_s']:.2f} s "
+          f"({results['throughput_fps']:.1f} fps), hands found in {results['hands_found']}, "
+          f"{results['annotations_saved']} annotations saved")
+    print(f"{'stage':<18}{'p50':>8}{'p95':>8}{'p99':>8}  (ms)")
+    for stage, s in results['stages_ms'].items():
+        print(f"{stage:<18}{s['p50']:8.2f}{s['p95']:8.2f}{s['p99']:8.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline GestureTeach pipeline benchmark.")
+    parser.add_argument('--video', help="Video file to replay (default: synthetic frames)")
+    parser.add_argument('--frames', type=int, default=300, help="Number of frames to process")
+    parser.add_argument('--width', type=int, default=1280, help="Webcam frame width")
+    parser.add_argument('--height', type=int, default=720, help="Webcam frame height")
+    parser.add_argument('--inference-width', type=int, default=640, help="Width of the image fed to MediaPipe")
+    parser.add_argument('--detector', choices=['inline', 'process'], default='inline')
+    parser.add_argument('--roi', action='store_true', help="Enable ROI tracking (compare on a --video with hands in it)")
+    parser.add_argument('--display-size', default='1280x720',
+                        help="Slide label size WxH the slide is composited at ('' = full 1920x1080)")
+    parser.add_argument('--full-res-annotations', action='store_true',
+                        help="Rasterize slide annotations at 1920x1080 instead of the display size")
+    parser.add_argument('--blackboard', action='store_true', help="Composite with the blackboard effect")
+    parser.add_argument('--opacity', type=float, default=1.0, help="Opacity of the drawings (0-1)")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    results = run_benchmark(args)
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0 if results['frames'] > 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
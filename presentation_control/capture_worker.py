@@ -0,0 +1,107 @@
+import cv2
+import logging
+import threading
+import time
+from pipeline import BufferPool, FramePacket, StageQueue
+
+class CaptureWorker:
+    """Background thread that owns the webcam and keeps only the newest frame.
+
+    The GUI thread never touches cv2.VideoCapture directly. Frames are
+    published as FramePackets into output_queue, a single-slot drop-oldest
+    StageQueue, so whoever consumes it always gets the most recent frame.
+    """
+    def __init__(self, camera_indices=(0, 1), width=1280, height=720, perf_monitor=None):
+        self.camera_indices = camera_indices
+        self.perf_monitor = perf_monitor  # Optional PerfMonitor, records 'capture' (time blocked in read())
+        self.on_frame = None  # Optional callable(capture_time), called on the capture thread for every frame read
+        self.width = width    # Requested size, updated to the actual size after open()
+        self.height = height
+        self.camera_index = None
+        self.cap = None
+
+        # Single-slot buffer: each new frame replaces the previous one
+        self.output_queue = StageQueue("capture", maxsize=1, on_drop=FramePacket.release)
+        self.frame_pool = BufferPool("capture")  # read() decodes into a free buffer instead of allocating
+        self._frame_id = 0
+        self._thread = None
+        self._running = False
+
+    def open(self):
+        """Open the first working camera index and apply the requested resolution."""
+        for index in self.camera_indices:
+            cap = cv2.VideoCapture(index)
+            if cap.isOpened():
+                self.cap = cap
+                self.camera_index = index
+                break
+            cap.release()
+            logging.warning(f"Webcam index {index} not available.")
+        if self.cap is None:
+            logging.critical(f"Failed to open webcam (tried indices {list(self.camera_indices)}).")
+            return False
+        logging.info(f"Using webcam index {self.camera_index}.")
+
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        # Keep the driver-side queue short so we always see fresh frames
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        actual_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        actual_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if actual_width != self.width or actual_height != self.height:
+            logging.warning(f"Webcam resolution set to {actual_width}x{actual_height}, requested {self.width}x{self.height}.")
+            self.width = actual_width
+            self.height = actual_height
+        else:
+            logging.info(f"Webcam resolution set to {self.width}x{self.height}.")
+        return True
+
+    def start(self):
+        """Start the capture thread (open() must have succeeded)."""
+        if self.cap is None or self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="CaptureWorker", daemon=True)
+        self._thread.start()
+        logging.info("Capture worker started.")
+
+    def _run(self):
+        """Capture loop: blocks on the device so nobody else has to."""
+        consecutive_failures = 0
+        while self._running:
+            read_start = time.time()
+            buf = self.frame_pool.acquire((self.height, self.width, 3))
+            success, frame = self.cap.read(buf)
+            if self.perf_monitor is not None:
+                self.perf_monitor.record_since('capture', read_start)
+            if not success or frame is not buf:
+                self.frame_pool.release(buf) # Failed, or the backend returned its own array
+            if not success or frame is None:
+                consecutive_failures += 1
+                if consecutive_failures == 1 or consecutive_failures % 100 == 0:
+                    logging.error(f"Cannot read frame from webcam ({consecutive_failures} consecutive failures).")
+                time.sleep(0.01)  # Avoid spinning on a dead device
+                continue
+            consecutive_failures = 0
+            self._frame_id += 1
+            packet = FramePacket(self._frame_id, frame)
+            if frame is buf:
+                packet.hold(self.frame_pool, buf) # Released once the inference stage has mirrored it
+            if self.on_frame is not None:
+                self.on_frame(packet.capture_time) # Before the single-slot queue can drop it
+            self.output_queue.put(packet)
+
+    def stop(self):
+        """Stop the capture thread and release the webcam."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            if self._thread.is_alive():
+                # Releasing under a blocked read() can crash some backends
+                logging.warning("Capture thread did not stop in time; leaving webcam to the OS.")
+                return
+            self._thread = None
+        if self.cap is not None and self.cap.isOpened():
+            self.cap.release()
+            logging.info("Webcam released.")
+        self.cap = None
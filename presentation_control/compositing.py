@@ -0,0 +1,180 @@
+import cv2
+import math
+import threading
+import numpy as np
+
+# Blackboard effect: darken the slide towards this color
+BLACKBOARD_COLOR = (20, 20, 20)
+BLACKBOARD_ALPHA = 0.7
+
+def flatten_layers(layers):
+    """Merge drawing layers [(color, alpha), ...] (later ones on top) into a single (color, alpha).
+
+    Empty layers are skipped; returns (None, None) if nothing is drawn. Colors
+    are black wherever their alpha is 0, so the result is too.
+    """
+    layers = [(color, alpha) for color, alpha in layers if alpha is not None and cv2.countNonZero(alpha)]
+    if not layers:
+        return None, None
+    if len(layers) == 1:
+        return layers[0]
+    color, alpha = layers[0][0].copy(), layers[0][1].copy()
+    for layer_color, layer_alpha in layers[1:]:
+        cv2.copyTo(layer_color, layer_alpha, color)
+        cv2.max(alpha, layer_alpha, alpha)
+    return color, alpha
+
+def overlay_layers(img, layers, opacity=1.0):
+    """Paste the drawing layers over img, in place, where their alpha is set. Returns img.
+
+    At full opacity this is a single masked copy; otherwise the drawings are
+    blended with img first. Layers must be img's size.
+    """
+    color, alpha = flatten_layers(layers)
+    if color is None:
+        return img
+    if opacity < 1.0:
+        color = cv2.addWeighted(color, opacity, img, 1.0 - opacity, 0.0)
+    cv2.copyTo(color, alpha, img)
+    return img
+
+def slide_background(base_image, blackboard_mode=False):
+    """Slide without drawings: a copy of base_image, darkened in blackboard mode."""
+    if not blackboard_mode:
+        return base_image.copy()
+    blackboard = np.full_like(base_image, BLACKBOARD_COLOR, dtype=np.uint8)
+    return cv2.addWeighted(blackboard, BLACKBOARD_ALPHA, base_image, 1.0 - BLACKBOARD_ALPHA, 0.0)
+
+def scaled_slide_background(base_image, size, blackboard_mode=False):
+    """slide_background() resized to size (w, h) for display."""
+    if size is None or size == (base_image.shape[1], base_image.shape[0]):
+        return slide_background(base_image, blackboard_mode)
+    interpolation = cv2.INTER_AREA if size[0] < base_image.shape[1] else cv2.INTER_LINEAR
+    return slide_background(cv2.resize(base_image, size, interpolation=interpolation), blackboard_mode)
+
+def compose_slide(base_image, layers=None, blackboard_mode=False, opacity=1.0):
+    """Slide as shown on screen (full resolution): optional blackboard effect plus the slide drawing layers."""
+    img = slide_background(base_image, blackboard_mode)
+    if layers:
+        overlay_layers(img, layers, opacity)
+    return img
+
+def overlay_layers_scaled(img, layers, opacity=1.0):
+    """Overlay drawing layers of another resolution onto img. Returns a new image.
+
+    The flattened drawings and their alpha are resized to img's size with
+    INTER_AREA; since the drawings are black where alpha is 0, the resized
+    drawings are already premultiplied by the resized alpha (the coverage), so
+    strokes blend into the slide the way they did when the full-size composite
+    was smooth-scaled.
+    """
+    color, alpha = flatten_layers(layers)
+    if color is None:
+        return img
+    size = (img.shape[1], img.shape[0])
+    coverage = cv2.resize(alpha, size, interpolation=cv2.INTER_AREA)
+    drawings = cv2.resize(color, size, interpolation=cv2.INTER_AREA)
+    if opacity < 1.0:
+        drawings = cv2.convertScaleAbs(drawings, alpha=opacity)
+    keep = cv2.cvtColor(cv2.convertScaleAbs(coverage, alpha=-opacity, beta=255), cv2.COLOR_GRAY2BGR) # 255 - opacity * coverage
+    return cv2.add(cv2.multiply(img, keep, scale=1.0 / 255), drawings)
+
+class SlideCompositor:
+    """Keeps the composited slide and only redoes the regions that changed.
+
+    compose() takes the slide background (slide + blackboard effect, already
+    at the size to display) and the drawing layers [(color, alpha), ...] of
+    the slide canvas. A new background object -- another slide, blackboard
+    toggle, resize -- rebuilds the composite; otherwise only the dirty rects
+    reported by the drawing canvas are recomposited, mapped to display
+    coordinates. An idle slide costs nothing.
+
+    compose() returns the cached composite, which is updated in place by later
+    calls: copy it if it has to outlive the next compose(), or pass rgb_dst
+    to get an RGB copy made under the compositor's lock.
+    """
+    def __init__(self, max_rects=16, opacity=1.0):
+        self.max_rects = max_rects  # Beyond this, dirty rects are merged into their bounding box
+        self.opacity = opacity      # Opacity of the drawings over the slide (call invalidate() after changing it)
+        self._lock = threading.Lock()
+        self._background = None
+        self._composite = None
+
+    def invalidate(self):
+        """Force a full rebuild on the next compose()."""
+        with self._lock:
+            self._background = None
+
+    def compose(self, background, layers=None, dirty_rects=None, rgb_dst=None):
+        """Composite for background. dirty_rects: changed (x0, y0, x1, y1) layer areas, None = everything.
+
+        With rgb_dst (background's shape), the composite is converted to RGB
+        into it before the lock is released and rgb_dst is returned instead: a
+        snapshot another thread can read while later calls update the composite.
+        """
+        with self._lock:
+            composite = self._compose(background, layers, dirty_rects)
+            if rgb_dst is None:
+                return composite
+            return cv2.cvtColor(composite, cv2.COLOR_BGR2RGB, dst=rgb_dst)
+
+    def _compose(self, background, layers, dirty_rects):
+        if self._background is not background:
+            self._background = background
+            if self._composite is None or self._composite.shape != background.shape:
+                self._composite = background.copy()
+            else:
+                np.copyto(self._composite, background) # Same display size: reuse the buffer
+            dirty_rects = None
+        if not layers:
+            if dirty_rects is None:
+                self._composite[:] = background
+            return self._composite
+        ch, cw = layers[0][0].shape[:2]
+        if dirty_rects is None:
+            dirty_rects = [(0, 0, cw, ch)]
+        elif len(dirty_rects) > self.max_rects:
+            dirty_rects = [(min(r[0] for r in dirty_rects), min(r[1] for r in dirty_rects),
+                            max(r[2] for r in dirty_rects), max(r[3] for r in dirty_rects))]
+        for rect in dirty_rects:
+            self._recompose(rect, layers)
+        return self._composite
+
+    def _recompose(self, rect, layers):
+        x0, y0, x1, y1 = rect
+        dh, dw = self._composite.shape[:2]
+        ch, cw = layers[0][0].shape[:2]
+        if (dw, dh) == (cw, ch):
+            region = (slice(y0, y1), slice(x0, x1))
+            self._composite[region] = self._background[region]
+            overlay_layers(self._composite[region], [(color[region], alpha[region]) for color, alpha in layers], self.opacity)
+            return
+        # Resample on whole blocks of the scale ratio so a patch is resized exactly like the full layer
+        (ry, wy), (rx, wx) = _block_span(y0, y1, ch, dh), _block_span(x0, x1, cw, dw)
+        src = (slice(ry[0] * ch // dh, ry[1] * ch // dh), slice(rx[0] * cw // dw, rx[1] * cw // dw))
+        patch = overlay_layers_scaled(self._background[ry[0]:ry[1], rx[0]:rx[1]],
+                                      [(color[src], alpha[src]) for color, alpha in layers], self.opacity)
+        self._composite[wy[0]:wy[1], wx[0]:wx[1]] = patch[wy[0] - ry[0]:wy[1] - ry[0], wx[0] - rx[0]:wx[1] - rx[0]]
+
+def _block_span(lo, hi, layer_len, display_len):
+    """Display ranges (read, write) to redo for the layer range [lo, hi) along one axis.
+
+    The axis is cut into blocks of layer_len / g layer pixels that map onto
+    display_len / g display pixels (g = gcd). Resizing a run of whole blocks
+    gives the same pixels as resizing the whole layer, so the written blocks
+    cover the change plus one block on each side (interpolation reaches over
+    block edges), and are computed from one more block on each side.
+    """
+    g = math.gcd(layer_len, display_len)
+    block, display_block = layer_len // g, display_len // g
+    b0, b1 = max(0, lo // block - 1), min(g, -(-hi // block) + 1)
+    r0, r1 = max(0, b0 - 1), min(g, b1 + 1)
+    return (r0 * display_block, r1 * display_block), (b0 * display_block, b1 * display_block)
+
+def compose_webcam(frame, layers, opacity=1.0, dst=None):
+    """Webcam frame with the webcam drawing layers on top, in dst (or a new image). Never modifies frame."""
+    if dst is None:
+        dst = frame.copy()
+    else:
+        np.copyto(dst, frame)
+    return overlay_layers(dst, layers, opacity)
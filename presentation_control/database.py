@@ -7,6 +7,8 @@ from dotenv import load_dotenv
 import json
 import logging
 
+ANNOTATION_BATCH_SIZE = 1000  # Rows per multi-row INSERT when saving annotations (keeps statements under max_allowed_packet)
+
 # Thiết lập logging
 logging.basicConfig(level=logging.INFO, filename='gesture_teach.log', format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -248,30 +250,53 @@ class Database:
 
     def save_annotation(self, slide_id, user_id, data):
         """Save annotation data for a slide as JSON."""
-        try:
-            cursor = self.connection.cursor()
-            query = "INSERT INTO annotations (slide_id, user_id, data, created_at) VALUES (%s, %s, %s, NOW())"
+        return self.save_annotations(slide_id, user_id, [data])
+
+    def save_annotations(self, slide_id, user_id, annotations):
+        """Save a list of annotations (dicts or JSON strings) for a slide in one transaction.
+
+        Rows are written with executemany, which mysql.connector turns into
+        multi-row INSERTs, and committed once; on error nothing is saved.
+        """
+        rows = []
+        for data in annotations:
             if isinstance(data, dict):
                 data = json.dumps(data)
-            # Kiểm tra xem data có phải JSON hợp lệ không
-            json.loads(data)  # Nếu không hợp lệ, sẽ raise JSONDecodeError
-            cursor.execute(query, (slide_id, user_id, data))
+            else:
+                # Kiểm tra xem data có phải JSON hợp lệ không (dicts are always valid)
+                try:
+                    json.loads(data)
+                except (TypeError, json.JSONDecodeError) as e:
+                    logging.error(f"Invalid JSON data: {data}, Error: {e}")
+                    return False
+            rows.append((slide_id, user_id, data))
+        if not rows:
+            return True
+        try:
+            cursor = self.connection.cursor()
+            query = "INSERT INTO annotations (slide_id, user_id, data) VALUES (%s, %s, %s)"
+            for start in range(0, len(rows), ANNOTATION_BATCH_SIZE):
+                cursor.executemany(query, rows[start:start + ANNOTATION_BATCH_SIZE])
             self.connection.commit()
             return True
-        except json.JSONDecodeError as e:
-            logging.error(f"Invalid JSON data: {data}, Error: {e}")
-            return False
         except Error as e:
-            logging.error(f"Error saving annotation: {e}")
+            logging.error(f"Error saving {len(rows)} annotations: {e}")
+            try:
+                self.connection.rollback()
+            except Error as rollback_error:
+                # Connection lost: the uncommitted rows are discarded by the server anyway
+                logging.error(f"Error rolling back annotation save: {rollback_error}")
             return False
         finally:
-            cursor.close()
+            if 'cursor' in locals() and cursor is not None:
+                cursor.close()
 
     def load_annotations(self, slide_id, user_id):
         """Load all annotations for a specific slide and user, expecting JSON data."""
         try:
             cursor = self.connection.cursor()
-            query = "SELECT data FROM annotations WHERE slide_id = %s AND user_id = %s ORDER BY created_at"
+            # id breaks created_at ties: rows saved together share a timestamp
+            query = "SELECT data FROM annotations WHERE slide_id = %s AND user_id = %s ORDER BY created_at, id"
             cursor.execute(query, (slide_id, user_id))
             annotations = cursor.fetchall()
             result = []
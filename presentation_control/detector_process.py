@@ -0,0 +1,145 @@
+import logging
+import multiprocessing as mp_proc
+import os
+from multiprocessing import shared_memory
+import numpy as np
+from hand_detector import HandDetector
+
+def _detector_worker(conn, shm_name, detector_kwargs, cpu_core):
+    """Child process: run MediaPipe on frames written into shared memory.
+
+    Protocol over `conn`: receives (height, width) after each frame has been
+    written, answers with a (num_hands, 21, 3) float32 array of normalized
+    landmarks. Receiving None shuts the worker down.
+    """
+    if cpu_core is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, {cpu_core})
+        except OSError as e:
+            logging.warning(f"Could not pin detector process to CPU {cpu_core}: {e}")
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        detector = HandDetector(**detector_kwargs)
+        conn.send('ready')
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            h, w = request
+            frame = np.ndarray((h, w, 3), dtype=np.uint8, buffer=shm.buf)  # Zero-copy view
+            detector.find_hands(frame, draw=False)
+            del frame  # Release the view before the buffer can be closed
+            conn.send(detector.hand_landmarks)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        shm.close()
+
+class ProcessHandDetector(HandDetector):
+    """HandDetector that runs MediaPipe in a separate process.
+
+    Frames are copied once into a shared-memory block (the child reads them
+    through a zero-copy numpy view) and only landmark arrays come back, so
+    inference CPU time and the GIL are kept away from the GUI process.
+    Exposes the same find_hands / find_position / fingers_up interface.
+    """
+    def __init__(self, static_image_mode=False, max_hands=2, min_detection_confidence=0.3,
+                 min_tracking_confidence=0.5, inference_size=None, roi_tracking=False, roi_padding=0.5,
+                 rgb_input=False, cpu_core=None, response_timeout=2.0):
+        # HandDetector.__init__ is deliberately not called: the model lives in the worker process
+        self.static_image_mode = static_image_mode
+        self.max_hands = max_hands
+        self.min_detection_confidence = min_detection_confidence
+        self.min_tracking_confidence = min_tracking_confidence
+        self.tip_ids = [4, 8, 12, 16, 20]
+        # Downscaling happens here, straight into shared memory; the child gets frames at inference size
+        self.inference_size = tuple(inference_size) if inference_size else None
+        self._small_buf = None
+        self.rgb_input = rgb_input  # Passed on to the child, which does the conversion if needed
+        self.detector_kwargs = {
+            'static_image_mode': static_image_mode,
+            'max_hands': max_hands,
+            'min_detection_confidence': min_detection_confidence,
+            'min_tracking_confidence': min_tracking_confidence,
+            'rgb_input': rgb_input,
+        }
+        self.cpu_core = cpu_core
+        self.response_timeout = response_timeout
+        self.startup_timeout = 15.0  # Model loading in the child can take a while
+        self._init_landmark_buffers()  # hand_landmarks holds the last result received from the child
+        self._init_roi_tracking(roi_tracking, roi_padding)  # Crops are cut here, so the child only sees small images
+        self._ctx = mp_proc.get_context('spawn')  # Never fork a process that runs Qt and worker threads
+        self._process = None
+        self._conn = None
+        self._shm = None
+        self._start_failed = False  # Don't retry (and block for startup_timeout) on every frame
+
+    def _start_worker(self, nbytes):
+        """(Re)start the detector process with a shared-memory block of at least nbytes."""
+        self.close()
+        self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        parent_conn, child_conn = self._ctx.Pipe()
+        self._process = self._ctx.Process(target=_detector_worker, name="HandDetectorProcess",
+                                          args=(child_conn, self._shm.name, self.detector_kwargs, self.cpu_core),
+                                          daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        if not self._conn.poll(self.startup_timeout) or self._conn.recv() != 'ready':
+            logging.error("Hand detector process failed to start; hand detection disabled.")
+            self.close()
+            self._start_failed = True
+            return False
+        logging.info(f"Hand detector process started (pid {self._process.pid}, shared memory {nbytes} bytes, cpu {self.cpu_core}).")
+        return True
+
+    def _infer(self, img):
+        """Send a frame or crop to the detector process; landmarks normalized to img go to _norm_buf."""
+        if self._start_failed:
+            return 0
+        w, h = self.input_size(img)
+        if self._shm is None or self._shm.size < h * w * 3:
+            # Size the block for the full frame so ROI crops never force a restart
+            full_w, full_h = self.inference_size if self.inference_size else self._frame_size
+            if not self._start_worker(max(full_w * full_h * 3, h * w * 3)):
+                return 0
+
+        # The single copy on the way in: webcam frame/crop -> (resize) -> shared memory
+        frame_view = np.ndarray((h, w, 3), dtype=np.uint8, buffer=self._shm.buf)
+        if self.prepare_input(img, dst=frame_view) is img:
+            np.copyto(frame_view, img)
+        del frame_view
+        try:
+            self._conn.send((h, w))
+            if not self._conn.poll(self.response_timeout):
+                logging.error("Hand detector process timed out; restarting it on the next frame.")
+                self.close()
+                return 0
+            hands = self._conn.recv()
+        except (EOFError, OSError, BrokenPipeError) as e:
+            logging.error(f"Lost connection to hand detector process: {e}")
+            self.close()
+            return 0
+        num_hands = min(len(hands), self.max_hands)
+        self._norm_buf[:num_hands] = hands[:num_hands]
+        return num_hands
+
+    def close(self):
+        """Stop the detector process and free the shared memory."""
+        if self._conn is not None:
+            try:
+                self._conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+            self._conn.close()
+            self._conn = None
+        if self._process is not None:
+            self._process.join(timeout=2.0)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
@@ -4,28 +4,60 @@ import cv2
 import numpy as np
 import json
 import logging
+import threading
 import time
 
 class DrawingCanvas:
     """Canvas for drawing on slides and webcam feed."""
-    def __init__(self, slide_width=1920, slide_height=1080, webcam_width=1280, webcam_height=720):
+    def __init__(self, slide_width=1920, slide_height=1080, webcam_width=1280, webcam_height=720, display_resolution=False,
+                 webcam_rgb=False):
         self.slide_width = slide_width
         self.slide_height = slide_height
         self.webcam_width = webcam_width
         self.webcam_height = webcam_height
+        # webcam_rgb: the webcam frames composited under webcam_canvas are RGB, so paint it in RGB.
+        # Annotation colors are always stored as BGR.
+        self.webcam_rgb = webcam_rgb
+        # Slide annotations are kept in slide coordinates (the annotation dicts in _slide_ops are the
+        # source of truth) but rasterized at slide_render_size. With display_resolution the GUI sets
+        # that to the on-screen slide size; full resolution is only rendered for screenshots/export.
+        self.display_resolution = display_resolution
+        self.slide_render_width, self.slide_render_height = slide_width, slide_height
+        self._render_sx, self._render_sy = 1.0, 1.0
+        self._slide_ops = []                # Committed slide annotations since the last clear, in order
+        self._slide_preview_shape = None    # (mode, start, end, color, brush_size) of the shape being dragged
         # Main drawing canvases (cleared on load)
         self.canvas = np.zeros((slide_height, slide_width, 3), dtype=np.uint8)
         self.webcam_canvas = np.zeros((webcam_height, webcam_width, 3), dtype=np.uint8)
         # Preview canvases for ongoing actions (like drawing shapes)
         self.preview_canvas = np.zeros((slide_height, slide_width, 3), dtype=np.uint8)
         self.webcam_preview_canvas = np.zeros((webcam_height, webcam_width, 3), dtype=np.uint8)
+        # Alpha plane per canvas: 255 where something is drawn, 0 where transparent (colors are black there).
+        # Compositing copies the drawings where alpha is set, so black strokes work too.
+        self.canvas_alpha = np.zeros((slide_height, slide_width), dtype=np.uint8)
+        self.webcam_alpha = np.zeros((webcam_height, webcam_width), dtype=np.uint8)
+        self.preview_alpha = np.zeros((slide_height, slide_width), dtype=np.uint8)
+        self.webcam_preview_alpha = np.zeros((webcam_height, webcam_width), dtype=np.uint8)
         logging.info(f"DrawingCanvas initialized: Slide({slide_width}x{slide_height}), Webcam({webcam_width}x{webcam_height})")
 
+        # Dirty-region tracking for the slide canvases (canvas + preview_canvas), consumed by the
+        # slide compositor via take_slide_dirty(). Drawing happens on the GUI thread, compositing
+        # on a worker thread, hence the lock.
+        self._dirty_lock = threading.Lock()
+        self._slide_dirty_rects = []    # (x0, y0, x1, y1), end exclusive
+        self._slide_dirty_full = True   # Whole slide needs recompositing
+        self._slide_preview_rect = None # Area currently covered by the shape preview
+        self.slide_version = 0          # Bumped on every visible change to the slide canvases
+
         # Drawing state variables
         self.slide_prev_x, self.slide_prev_y = None, None
         self.webcam_prev_x, self.webcam_prev_y = None, None
         self.slide_shape_start = None
         self.webcam_shape_start = None
+        # Open strokes: pen and erase samples are added to these until the finger lifts (see _add_stroke_point)
+        self._slide_stroke = None
+        self._webcam_stroke = None
+        self._erase_stroke = None
 
         # Color definitions
         self.colors = [(0, 0, 255), (0, 255, 0), (255, 0, 0), (255, 255, 0)] # BGR: Red, Green, Blue, Yellow
@@ -38,7 +70,8 @@ class DrawingCanvas:
         self.brush_size = 5
         # Opacity REMOVED
 
-        # Temporary storage for annotations within a session or before saving
+        # Temporary storage for annotations within a session or before saving: pen and erase strokes
+        # ({style..., 'points': [x0, y0, x1, y1, ...]}), finalized shapes and clear markers
         self.current_annotations = []
 
     def _get_current_color(self, blackboard_mode=False):
@@ -49,6 +82,35 @@ class DrawingCanvas:
         # logging.debug(f"Getting color: Index={idx}, Blackboard={blackboard_mode}, Color={colors[idx]}, Name={names[idx]}")
         return colors[idx]
 
+    def _webcam_color(self, color):
+        """BGR annotation color in the channel order of the webcam canvas."""
+        return tuple(reversed(color)) if self.webcam_rgb else color
+
+    def _add_stroke_point(self, stroke, style, point, prev=None):
+        """Add point to the open stroke, or to a new one if there is none or its style changed.
+
+        A stroke is one annotation: its style once, then a flat point list. A
+        new stroke is appended to current_annotations and starts at prev (when
+        given), so it joins the stroke before it. Returns (stroke, first), first
+        being the index of the first point that is not drawn yet.
+        """
+        if stroke is None or any(stroke.get(key) != value for key, value in style.items()):
+            stroke = dict(style, points=[], timestamp=time.time())
+            if prev is not None:
+                stroke['points'] += [int(prev[0]), int(prev[1])]
+            self.current_annotations.append(stroke)
+            first = 0
+        else:
+            first = len(stroke['points']) // 2
+        stroke['points'] += [int(point[0]), int(point[1])]
+        return stroke, first
+
+    def end_strokes(self):
+        """Close the open strokes: further samples start new ones (call before saving current_annotations)."""
+        self._slide_stroke = None
+        self._webcam_stroke = None
+        self._erase_stroke = None
+
     def draw(self, x_norm, y_norm, mode="pen", blackboard_mode=False):
         """Draw on the slide canvas based on normalized (e.g., 800x600) coordinates."""
         # Convert normalized coordinates to slide canvas coordinates
@@ -57,6 +119,20 @@ class DrawingCanvas:
         # logging.debug(f"Draw SLIDE: Norm=({x_norm},{y_norm}), Canvas=({x},{y}), Mode={mode}")
 
         color = self._get_current_color(blackboard_mode)
+        if mode == "pen":
+            # The sample extends the open stroke; a line from the previous point, or a small circle at the start
+            prev = (self.slide_prev_x, self.slide_prev_y) if self.slide_prev_x is not None else None
+            stroke, first = self._add_stroke_point(
+                self._slide_stroke, {'type': 'pen', 'color': color, 'brush_size': self.brush_size, 'target': 'slide'}, (x, y), prev)
+            if first == 0:
+                self._slide_ops.append(stroke)
+            self._slide_stroke = stroke
+            self._erase_stroke = None # Erasing again later must replay after this stroke
+            self._rasterize_slide_op(self.canvas, stroke, first=first)
+            # Update previous point for the next segment
+            self.slide_prev_x, self.slide_prev_y = x, y
+            return stroke
+
         # Create annotation data structure for potential saving
         annotation = {
             'type': mode,
@@ -67,17 +143,7 @@ class DrawingCanvas:
             'timestamp': time.time() # Add timestamp
         }
 
-        if mode == "pen":
-            # If previous point exists, draw a line
-            if self.slide_prev_x is not None and self.slide_prev_y is not None:
-                cv2.line(self.canvas, (self.slide_prev_x, self.slide_prev_y), (x, y), color, self.brush_size)
-                annotation['prev_coords'] = (self.slide_prev_x, self.slide_prev_y) # Store previous point for line drawing on load
-            else:
-                # If no previous point (start of stroke), draw a small circle
-                cv2.circle(self.canvas, (x, y), max(1, self.brush_size // 2), color, -1)
-            # Update previous point for the next segment
-            self.slide_prev_x, self.slide_prev_y = x, y
-        elif mode in ["circle", "square"]:
+        if mode in ["circle", "square"]:
             # If this is the first point of the shape
             if self.slide_shape_start is None:
                 self.slide_shape_start = (x, y)
@@ -86,16 +152,17 @@ class DrawingCanvas:
             else:
                 # If shape has started, update the preview
                 current_shape_end = (x, y)
-                self.preview_canvas.fill(0) # Clear previous preview
+                self._clear_slide_preview() # Clear previous preview
                 # Draw the shape on the temporary preview canvas
-                self.draw_shape(self.preview_canvas, self.slide_shape_start, current_shape_end, mode, color, self.brush_size)
+                self._slide_preview_shape = (mode, self.slide_shape_start, current_shape_end, color, self.brush_size)
+                self._draw_slide_preview()
                 # Update annotation with start and current end (this will be overwritten until finger lifts)
                 annotation['shape_start'] = self.slide_shape_start
                 annotation['shape_end'] = current_shape_end
                 # logging.debug(f"Slide shape PREVIEW updated: Start={self.slide_shape_start}, End={current_shape_end}")
 
 
-        # Append the annotation (either pen segment or shape update) to the temporary list
+        # Append the shape update to the temporary list
         self.current_annotations.append(annotation)
         return annotation # Return the created annotation (optional)
 
@@ -108,6 +175,17 @@ class DrawingCanvas:
 
 
         color = self._get_current_color(blackboard_mode)
+        if mode == "pen":
+            prev = (self.webcam_prev_x, self.webcam_prev_y) if self.webcam_prev_x is not None else None
+            stroke, first = self._add_stroke_point(
+                self._webcam_stroke, {'type': 'pen', 'color': color, 'brush_size': self.brush_size, 'target': 'webcam'}, (x, y), prev)
+            self._webcam_stroke = stroke
+            self._erase_stroke = None
+            self._paint_stroke(self.webcam_canvas, self.webcam_alpha, self._stroke_points(stroke, max(first - 1, 0)),
+                               self._webcam_color(color), self.brush_size, dot=first == 0)
+            self.webcam_prev_x, self.webcam_prev_y = x, y
+            return stroke
+
         # Create annotation data structure
         annotation = {
             'type': mode,
@@ -118,14 +196,7 @@ class DrawingCanvas:
             'timestamp': time.time()
         }
 
-        if mode == "pen":
-            if self.webcam_prev_x is not None and self.webcam_prev_y is not None:
-                cv2.line(self.webcam_canvas, (self.webcam_prev_x, self.webcam_prev_y), (x, y), color, self.brush_size)
-                annotation['prev_coords'] = (self.webcam_prev_x, self.webcam_prev_y)
-            else:
-                cv2.circle(self.webcam_canvas, (x, y), max(1, self.brush_size // 2), color, -1)
-            self.webcam_prev_x, self.webcam_prev_y = x, y
-        elif mode in ["circle", "square"]:
+        if mode in ["circle", "square"]:
             if self.webcam_shape_start is None:
                 self.webcam_shape_start = (x, y)
                 annotation['shape_start'] = self.webcam_shape_start
@@ -133,7 +204,8 @@ class DrawingCanvas:
             else:
                 current_shape_end = (x, y)
                 self.webcam_preview_canvas.fill(0) # Clear previous preview
-                self.draw_shape(self.webcam_preview_canvas, self.webcam_shape_start, current_shape_end, mode, color, self.brush_size)
+                self.webcam_preview_alpha.fill(0)
+                self.draw_shape(self.webcam_preview_canvas, self.webcam_shape_start, current_shape_end, mode, self._webcam_color(color), self.brush_size)
                 annotation['shape_start'] = self.webcam_shape_start
                 annotation['shape_end'] = current_shape_end
                 # logging.debug(f"Webcam shape PREVIEW updated: Start={self.webcam_shape_start}, End={current_shape_end}")
@@ -142,8 +214,8 @@ class DrawingCanvas:
         self.current_annotations.append(annotation)
         return annotation
 
-    def draw_shape(self, canvas_to_draw_on, start, end, mode, color, thickness):
-        """Helper function to draw a shape on a given canvas."""
+    def draw_shape(self, canvas_to_draw_on, start, end, mode, color, thickness, alpha=None):
+        """Helper function to draw a shape on a given canvas (and its alpha plane)."""
         if start is None or end is None:
             logging.warning("draw_shape called with None start or end point.")
             return
@@ -155,6 +227,10 @@ class DrawingCanvas:
         # Convert coordinates to integers just in case
         start = (int(start[0]), int(start[1]))
         end = (int(end[0]), int(end[1]))
+        if alpha is None:
+            alpha = self._alpha_of(canvas_to_draw_on)
+        if canvas_to_draw_on is self.canvas or canvas_to_draw_on is self.preview_canvas:
+            self._mark_slide_dirty(self._shape_rect(start, end, mode, thickness))
 
         try:
             if mode == "circle":
@@ -162,6 +238,8 @@ class DrawingCanvas:
                 radius = int(((end[0] - start[0]) ** 2 + (end[1] - start[1]) ** 2) ** 0.5)
                 if radius > 0:
                     cv2.circle(canvas_to_draw_on, (center_x, center_y), radius, color, thickness)
+                    if alpha is not None:
+                        cv2.circle(alpha, (center_x, center_y), radius, 255, thickness)
                     # logging.debug(f"Drew circle on canvas {id(canvas_to_draw_on)} at {start} radius {radius}")
             elif mode == "square":
                 start_x, start_y = start
@@ -175,6 +253,8 @@ class DrawingCanvas:
                 # Only draw if the rectangle has valid dimensions (width and height > 0)
                 if pt1[0] < pt2[0] and pt1[1] < pt2[1]:
                     cv2.rectangle(canvas_to_draw_on, pt1, pt2, color, thickness)
+                    if alpha is not None:
+                        cv2.rectangle(alpha, pt1, pt2, 255, thickness)
                     # logging.debug(f"Drew square on canvas {id(canvas_to_draw_on)} from {pt1} to {pt2}")
                 else:
                     logging.warning(f"Skipped drawing square with invalid dimensions: pt1={pt1}, pt2={pt2}")
@@ -189,23 +269,24 @@ class DrawingCanvas:
         erase_radius = max(5, self.brush_size * 2) # Make eraser size relative to brush size
         x_slide = min(max(int(x_norm * self.slide_width / 800), 0), self.slide_width - 1)
         y_slide = min(max(int(y_norm * self.slide_height / 600), 0), self.slide_height - 1)
-        # Erase on slide canvas by drawing black circles
-        cv2.circle(self.canvas, (x_slide, y_slide), erase_radius, (0, 0, 0), -1)
 
         # Erase on webcam canvas
         x_webcam = min(max(int(x_norm * self.webcam_width / 800), 0), self.webcam_width - 1)
         y_webcam = min(max(int(y_norm * self.webcam_height / 600), 0), self.webcam_height - 1)
-        cv2.circle(self.webcam_canvas, (x_webcam, y_webcam), erase_radius, (0, 0, 0), -1)
-
-        # Create an annotation for the erase action (mainly for slide canvas)
-        annotation = {
-            'type': 'erase',
-            'coords': (x_slide, y_slide), # Store slide coordinates for potential replay
-            'brush_size': erase_radius, # Store erase size
-            'target': 'both', # Indicate erase affects both (though only slide coords stored precisely)
-            'timestamp': time.time()
-        }
-        self.current_annotations.append(annotation)
+        self._erase_dot(self.webcam_canvas, self.webcam_alpha, (x_webcam, y_webcam), erase_radius)
+
+        # Add to the open erase stroke (slide coordinates and erase size, for replay).
+        # Target 'both': erase affects both canvases, though only slide coords are stored precisely
+        stroke, first = self._add_stroke_point(
+            self._erase_stroke, {'type': 'erase', 'brush_size': erase_radius, 'target': 'both'}, (x_slide, y_slide))
+        if first == 0:
+            self._slide_ops.append(stroke)
+        self._erase_stroke = stroke
+        # Pen samples after this erase go into new strokes, so replaying keeps the order
+        self._slide_stroke = None
+        self._webcam_stroke = None
+        # Erase on slide canvas by making discs transparent
+        self._rasterize_slide_op(self.canvas, stroke, first=first)
         # logging.debug(f"Erased at Slide:({x_slide},{y_slide}), Webcam:({x_webcam},{y_webcam}) Radius:{erase_radius}")
 
     def reset_points(self, mode="pen", blackboard_mode=False):
@@ -244,7 +325,7 @@ class DrawingCanvas:
             if last_shape_end:
                 # <<< DRAW ON MAIN SLIDE CANVAS >>>
                 logging.debug(f"Drawing final SLIDE shape. Start: {self.slide_shape_start}, End: {last_shape_end}, Mode: {mode}, TargetCanvas: self.canvas")
-                self.draw_shape(self.canvas, self.slide_shape_start, last_shape_end, mode, color, self.brush_size)
+                # (Rasterized below from the final annotation, at the slide render size)
                 # <<< TEST POINT >>>
                 # cv2.circle(self.canvas, (100, 100), 20, (0, 255, 255), -1) # Draw fixed yellow point
                 # logging.debug("Drew TEST yellow circle at (100, 100) on self.canvas")
@@ -259,6 +340,8 @@ class DrawingCanvas:
                     'target': 'slide',
                     'timestamp': time.time() # Use current time for final annotation
                 }
+                self._rasterize_slide_op(self.canvas, final_annotation)
+                self._slide_ops.append(final_annotation)
                 # Remove the temporary annotations associated with this shape drawing process
                 indices_to_remove.sort(reverse=True) # Sort indices high to low for safe deletion
                 logging.debug(f"Removing temporary slide shape annotations at indices: {indices_to_remove}")
@@ -302,7 +385,7 @@ class DrawingCanvas:
 
             if last_shape_end:
                 logging.debug(f"Drawing final WEBCAM shape. Start: {self.webcam_shape_start}, End: {last_shape_end}, Mode: {mode}, TargetCanvas: self.webcam_canvas")
-                self.draw_shape(self.webcam_canvas, self.webcam_shape_start, last_shape_end, mode, color, self.brush_size)
+                self.draw_shape(self.webcam_canvas, self.webcam_shape_start, last_shape_end, mode, self._webcam_color(color), self.brush_size)
                 final_annotation = {
                     'type': mode,
                     'shape_start': self.webcam_shape_start,
@@ -334,15 +417,17 @@ class DrawingCanvas:
                  logging.info(f"Discarded incomplete webcam shape starting at {self.webcam_shape_start}")
 
         # --- Reset States common to all modes or after finalization ---
-        # Reset pen drawing points
+        # Reset pen drawing points and close the strokes
         self.slide_prev_x, self.slide_prev_y = None, None
         self.webcam_prev_x, self.webcam_prev_y = None, None
+        self.end_strokes()
         # Reset shape start points
         self.slide_shape_start = None
         self.webcam_shape_start = None
         # Clear preview canvases
-        self.preview_canvas.fill(0)
+        self._clear_slide_preview()
         self.webcam_preview_canvas.fill(0)
+        self.webcam_preview_alpha.fill(0)
         logging.debug("Drawing points and previews reset.")
 
     def change_color(self):
@@ -358,6 +443,13 @@ class DrawingCanvas:
         self.webcam_canvas.fill(0)
         self.preview_canvas.fill(0)
         self.webcam_preview_canvas.fill(0)
+        for alpha in (self.canvas_alpha, self.webcam_alpha, self.preview_alpha, self.webcam_preview_alpha):
+            alpha.fill(0)
+        self._slide_preview_rect = None
+        self._slide_preview_shape = None
+        self._slide_ops = []
+        self._mark_slide_all_dirty()
+        self.end_strokes() # Later samples must come after the clear marker
         # Create the annotation AFTER clearing visually
         clear_annotation = {
             'type': 'clear_canvas',
@@ -386,6 +478,218 @@ class DrawingCanvas:
             logging.warning(f"Invalid brush size value received: {size}. Using default {self.brush_size}.")
             # Optionally keep the old value or set to default: self.brush_size = 5
 
+    # --- Raster primitives (color canvas + its alpha plane) ---
+    def _alpha_of(self, canvas):
+        """Alpha plane of one of the drawing canvases (None for any other buffer)."""
+        for color, alpha in ((self.canvas, self.canvas_alpha), (self.preview_canvas, self.preview_alpha),
+                             (self.webcam_canvas, self.webcam_alpha), (self.webcam_preview_canvas, self.webcam_preview_alpha)):
+            if canvas is color:
+                return alpha
+        return None
+
+    def _paint_line(self, canvas, alpha, p0, p1, color, thickness):
+        cv2.line(canvas, p0, p1, color, thickness)
+        if alpha is not None:
+            cv2.line(alpha, p0, p1, 255, thickness)
+
+    def _paint_dot(self, canvas, alpha, center, radius, color):
+        cv2.circle(canvas, center, radius, color, -1)
+        if alpha is not None:
+            cv2.circle(alpha, center, radius, 255, -1)
+
+    def _erase_dot(self, canvas, alpha, center, radius):
+        """Make a disc transparent again."""
+        cv2.circle(canvas, center, radius, (0, 0, 0), -1)
+        if alpha is not None:
+            cv2.circle(alpha, center, radius, 0, -1)
+
+    def _paint_stroke(self, canvas, alpha, points, color, thickness, dot=True):
+        """Pen stroke through points (N x 2 int32): a dot at the first one, then one polyline."""
+        if dot:
+            self._paint_dot(canvas, alpha, (int(points[0][0]), int(points[0][1])), max(1, thickness // 2), color)
+        if len(points) > 1:
+            cv2.polylines(canvas, [points], False, color, thickness)
+            if alpha is not None:
+                cv2.polylines(alpha, [points], False, 255, thickness)
+
+    def _stroke_points(self, stroke, start=0):
+        """Points of a stroke annotation from index start on, as an N x 2 int32 array."""
+        return np.array(stroke['points'][2 * start:], dtype=np.int32).reshape(-1, 2)
+
+    # --- Slide rasterization (annotations in slide coordinates -> canvas at the render size) ---
+    def _annotation_style(self, ann):
+        """(color, brush_size) of an annotation dict, with the same defaults as on load."""
+        color_data = ann.get('color')
+        if isinstance(color_data, (list, tuple)) and len(color_data) == 3:
+            color = tuple(int(c) for c in color_data) # Ensure components are int
+        else:
+            color = (0, 0, 255) # Default BGR Red
+        brush_size = max(1, int(ann.get('brush_size', 5))) # Ensure valid integer >= 1
+        return color, brush_size
+
+    def _to_render(self, point, sx=None, sy=None):
+        """Slide coordinates -> canvas coordinates at the render scale."""
+        sx = self._render_sx if sx is None else sx
+        sy = self._render_sy if sy is None else sy
+        return (int(int(point[0]) * sx), int(int(point[1]) * sy))
+
+    def _rasterize_slide_op(self, target_canvas, ann, sx=None, sy=None, target_alpha=None, first=0):
+        """Draw one slide annotation (pen/erase stroke, finalized shape) onto target_canvas.
+
+        Coordinates in ann are slide coordinates; they and the stroke width are
+        scaled by (sx, sy), the current render scale by default. target_alpha
+        defaults to the canvas's own alpha plane. For strokes, only the points
+        from index first on are drawn (joined to the one before). Returns False
+        if the annotation does not draw on the slide.
+        """
+        if target_alpha is None:
+            target_alpha = self._alpha_of(target_canvas)
+        sx = self._render_sx if sx is None else sx
+        sy = self._render_sy if sy is None else sy
+        mode = ann.get('type')
+        on_slide = ann.get('target', 'slide') in ['slide', 'both']
+        color, brush_size = self._annotation_style(ann)
+        thickness = max(1, int(round(brush_size * sx)))
+        rect = None
+        if mode == "pen" and on_slide and ann.get('points'):
+            points = self._stroke_points(ann, max(first - 1, 0))
+            if (sx, sy) != (1.0, 1.0):
+                points = (points * (sx, sy)).astype(np.int32)
+            self._paint_stroke(target_canvas, target_alpha, points, color, thickness, dot=first == 0)
+            rect = self._points_rect([points.min(axis=0), points.max(axis=0)], thickness)
+        elif mode == "erase" and ann.get('points'):
+            points = self._stroke_points(ann, first)
+            if (sx, sy) != (1.0, 1.0):
+                points = (points * (sx, sy)).astype(np.int32)
+            radius = max(1, int(round(int(ann.get('brush_size', max(5, self.brush_size * 2))) * sx)))
+            for center in points.tolist():
+                self._erase_dot(target_canvas, target_alpha, tuple(center), radius)
+            rect = self._points_rect([points.min(axis=0), points.max(axis=0)], radius * 2)
+        elif mode == "pen" and on_slide and ann.get('coords'): # Single segment, as saved before strokes
+            coords = self._to_render(ann['coords'], sx, sy)
+            if ann.get('prev_coords'):
+                prev_coords = self._to_render(ann['prev_coords'], sx, sy)
+                self._paint_line(target_canvas, target_alpha, prev_coords, coords, color, thickness)
+                rect = self._points_rect([prev_coords, coords], thickness)
+            else:
+                self._paint_dot(target_canvas, target_alpha, coords, max(1, thickness // 2), color)
+                rect = self._points_rect([coords], thickness)
+        elif mode in ["circle", "square"] and on_slide and ann.get('shape_start') and ann.get('shape_end'):
+            # draw_shape marks the area dirty itself when drawing on self.canvas
+            self.draw_shape(target_canvas, self._to_render(ann['shape_start'], sx, sy),
+                            self._to_render(ann['shape_end'], sx, sy), mode, color, thickness, target_alpha)
+        elif mode == "erase" and ann.get('coords'):
+            # Erase always applies to the slide (target 'both')
+            center = self._to_render(ann['coords'], sx, sy)
+            radius = max(1, int(round(int(ann.get('brush_size', max(5, self.brush_size * 2))) * sx)))
+            self._erase_dot(target_canvas, target_alpha, center, radius)
+            rect = self._points_rect([center], radius * 2)
+        else:
+            return False
+        if target_canvas is self.canvas:
+            self._mark_slide_dirty(rect)
+        return True
+
+    def _draw_slide_preview(self):
+        """Draw the shape being dragged onto preview_canvas at the render size."""
+        mode, start, end, color, brush_size = self._slide_preview_shape
+        thickness = max(1, int(round(brush_size * self._render_sx)))
+        start, end = self._to_render(start), self._to_render(end)
+        self.draw_shape(self.preview_canvas, start, end, mode, color, thickness)
+        self._slide_preview_rect = self._shape_rect(start, end, mode, thickness)
+
+    def set_slide_render_size(self, width, height):
+        """Rasterize slide annotations at width x height from now on (re-renders them from _slide_ops)."""
+        width, height = max(1, int(width)), max(1, int(height))
+        if (width, height) == (self.slide_render_width, self.slide_render_height):
+            return
+        self.slide_render_width, self.slide_render_height = width, height
+        self._render_sx, self._render_sy = width / self.slide_width, height / self.slide_height
+        # Render into new buffers and swap them in, so the compositing thread never sees a half-drawn canvas
+        canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        canvas_alpha = np.zeros((height, width), dtype=np.uint8)
+        for ann in self._slide_ops:
+            self._rasterize_slide_op(canvas, ann, target_alpha=canvas_alpha)
+        preview_shape = self._slide_preview_shape
+        self.canvas, self.canvas_alpha = canvas, canvas_alpha
+        self.preview_canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self.preview_alpha = np.zeros((height, width), dtype=np.uint8)
+        self._slide_preview_rect = None
+        if preview_shape is not None:
+            self._slide_preview_shape = preview_shape
+            self._draw_slide_preview()
+        self._mark_slide_all_dirty()
+        logging.info(f"Slide annotations rendered at {width}x{height} ({len(self._slide_ops)} annotations).")
+
+    def render_full_resolution(self, include_preview=True):
+        """Slide drawing layers [(color, alpha), ...] at full slide resolution (for screenshots/export)."""
+        if (self.slide_render_width, self.slide_render_height) == (self.slide_width, self.slide_height):
+            return self.get_slide_layers() if include_preview else [(self.canvas, self.canvas_alpha)]
+        full = np.zeros((self.slide_height, self.slide_width, 3), dtype=np.uint8)
+        full_alpha = np.zeros((self.slide_height, self.slide_width), dtype=np.uint8)
+        for ann in self._slide_ops:
+            self._rasterize_slide_op(full, ann, 1.0, 1.0, full_alpha)
+        if include_preview and self._slide_preview_shape is not None:
+            mode, start, end, color, brush_size = self._slide_preview_shape
+            self.draw_shape(full, start, end, mode, color, brush_size, full_alpha)
+        return [(full, full_alpha)]
+
+    # --- Dirty-region tracking (slide canvases) ---
+    def _clip_rect(self, x0, y0, x1, y1):
+        """Clip a rect to the slide canvas (render size); None if nothing is left."""
+        x0, y0 = max(0, int(x0)), max(0, int(y0))
+        x1, y1 = min(self.slide_render_width, int(x1)), min(self.slide_render_height, int(y1))
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return (x0, y0, x1, y1)
+
+    def _points_rect(self, points, thickness):
+        """Bounding rect of a stroke through the given points."""
+        pad = thickness // 2 + 2 # Half the line width plus antialiasing slack
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        return self._clip_rect(min(xs) - pad, min(ys) - pad, max(xs) + pad + 1, max(ys) + pad + 1)
+
+    def _shape_rect(self, start, end, mode, thickness):
+        """Bounding rect of a circle/square as drawn by draw_shape."""
+        if mode == "circle":
+            radius = int(((end[0] - start[0]) ** 2 + (end[1] - start[1]) ** 2) ** 0.5)
+            return self._points_rect([(start[0] - radius, start[1] - radius), (start[0] + radius, start[1] + radius)], thickness)
+        return self._points_rect([start, end], thickness)
+
+    def _mark_slide_dirty(self, rect):
+        """Record a changed area of the slide canvases (None = nothing visible changed)."""
+        if rect is None:
+            return
+        with self._dirty_lock:
+            self.slide_version += 1
+            if not self._slide_dirty_full:
+                self._slide_dirty_rects.append(rect)
+
+    def _mark_slide_all_dirty(self):
+        with self._dirty_lock:
+            self.slide_version += 1
+            self._slide_dirty_full = True
+            self._slide_dirty_rects = []
+
+    def _clear_slide_preview(self):
+        """Clear only the part of the slide preview that holds the current shape."""
+        self._slide_preview_shape = None
+        if self._slide_preview_rect is not None:
+            x0, y0, x1, y1 = self._slide_preview_rect
+            self.preview_canvas[y0:y1, x0:x1] = 0
+            self.preview_alpha[y0:y1, x0:x1] = 0
+            self._mark_slide_dirty(self._slide_preview_rect)
+            self._slide_preview_rect = None
+
+    def take_slide_dirty(self):
+        """Changed slide areas since the last call: a list of rects, or None if everything changed."""
+        with self._dirty_lock:
+            rects = None if self._slide_dirty_full else self._slide_dirty_rects
+            self._slide_dirty_rects = []
+            self._slide_dirty_full = False
+        return rects
+
     def get_preview(self):
         """Get the slide preview canvas (for ongoing shape drawing)."""
         return self.preview_canvas
@@ -394,6 +698,14 @@ class DrawingCanvas:
         """Get the webcam preview canvas."""
         return self.webcam_preview_canvas
 
+    def get_slide_layers(self):
+        """Slide drawing layers for compositing, bottom to top: [(color, alpha), ...]."""
+        return [(self.canvas, self.canvas_alpha), (self.preview_canvas, self.preview_alpha)]
+
+    def get_webcam_layers(self):
+        """Webcam drawing layers for compositing, bottom to top: [(color, alpha), ...]."""
+        return [(self.webcam_canvas, self.webcam_alpha), (self.webcam_preview_canvas, self.webcam_preview_alpha)]
+
     def load_annotations(self, annotations):
         """Load and render annotations from database onto the canvases."""
         # Start fresh by clearing all visual canvases
@@ -401,8 +713,15 @@ class DrawingCanvas:
         self.webcam_canvas.fill(0)
         self.preview_canvas.fill(0)
         self.webcam_preview_canvas.fill(0)
+        for alpha in (self.canvas_alpha, self.webcam_alpha, self.preview_alpha, self.webcam_preview_alpha):
+            alpha.fill(0)
+        self._slide_preview_rect = None
+        self._slide_preview_shape = None
+        self._slide_ops = []
+        self._mark_slide_all_dirty()
         # Clear the list of temporary annotations held by the canvas instance
         self.current_annotations = []
+        self.end_strokes()
         logging.info(f"Cleared canvases. Loading {len(annotations)} annotation parts from DB.")
 
         # Find the index of the last 'clear_canvas' event in the loaded data
@@ -429,42 +748,46 @@ class DrawingCanvas:
 
             try:
                 mode = ann.get('type')
-                # Default color to Red if missing or invalid format
+                color, brush_size = self._annotation_style(ann)
                 color_data = ann.get('color')
-                if isinstance(color_data, (list, tuple)) and len(color_data) == 3:
-                    color = tuple(int(c) for c in color_data) # Ensure components are int
-                else:
-                    color = (0, 0, 255) # Default BGR Red
-                    if color_data: logging.warning(f"Invalid color format {color_data} in annotation, using default Red.")
-
-                brush_size = ann.get('brush_size', 5) # Use 5 as default if missing
-                brush_size = max(1, int(brush_size)) # Ensure valid integer >= 1
+                if color_data and not (isinstance(color_data, (list, tuple)) and len(color_data) == 3):
+                    logging.warning(f"Invalid color format {color_data} in annotation, using default Red.")
                 target = ann.get('target', 'slide') # Default to slide if target is missing
 
                 # Determine which canvas(es) to draw on based on target
                 draw_on_slide = target in ['slide', 'both']
                 draw_on_webcam = target in ['webcam', 'both']
 
+                # Slide canvas: rasterized at the slide render size, and kept for re-rendering
+                if self._rasterize_slide_op(self.canvas, ann):
+                    self._slide_ops.append(ann)
+
                 # --- Render based on annotation type ---
-                if mode == "pen":
+                if mode == "pen" and ann.get('points') is not None:
+                    # Stroke: style once, then its points [x0, y0, x1, y1, ...]
+                    if ann['points']:
+                        if draw_on_webcam:
+                            self._paint_stroke(self.webcam_canvas, self.webcam_alpha, self._stroke_points(ann),
+                                               self._webcam_color(color), brush_size)
+                        rendered_count['pen'] += 1
+                        if draw_on_slide: rendered_count['slide'] += 1
+                        if draw_on_webcam: rendered_count['webcam'] += 1
+
+                elif mode == "pen": # One segment per annotation, as saved before strokes
                     coords_data = ann.get('coords')
                     prev_coords_data = ann.get('prev_coords')
                     if coords_data:
                         coords = (int(coords_data[0]), int(coords_data[1])) # Ensure int tuple
                         if prev_coords_data: # Draw a line segment
                             prev_coords = (int(prev_coords_data[0]), int(prev_coords_data[1]))
-                            if draw_on_slide:
-                                cv2.line(self.canvas, prev_coords, coords, color, brush_size)
                             if draw_on_webcam:
                                 # Need to check if webcam canvas exists and has correct shape
                                 # This assumes coords were originally for webcam if target is webcam/both
-                                cv2.line(self.webcam_canvas, prev_coords, coords, color, brush_size)
+                                self._paint_line(self.webcam_canvas, self.webcam_alpha, prev_coords, coords, self._webcam_color(color), brush_size)
                         else: # Draw the starting point of a pen stroke
                             start_radius = max(1, brush_size // 2)
-                            if draw_on_slide:
-                                cv2.circle(self.canvas, coords, start_radius, color, -1)
                             if draw_on_webcam:
-                                cv2.circle(self.webcam_canvas, coords, start_radius, color, -1)
+                                self._paint_dot(self.webcam_canvas, self.webcam_alpha, coords, start_radius, self._webcam_color(color))
                         rendered_count['pen'] += 1
                         if draw_on_slide: rendered_count['slide'] += 1
                         if draw_on_webcam: rendered_count['webcam'] += 1
@@ -480,17 +803,25 @@ class DrawingCanvas:
                         end = (int(end_data[0]), int(end_data[1]))
                         # Call the helper function to draw the shape on the appropriate canvas
                         if draw_on_slide:
-                            # logging.debug(f"Loading shape on slide: Start={start}, End={end}, Mode={mode}")
-                            self.draw_shape(self.canvas, start, end, mode, color, brush_size)
                             rendered_count['slide'] += 1
                         if draw_on_webcam:
                             # logging.debug(f"Loading shape on webcam: Start={start}, End={end}, Mode={mode}")
-                             self.draw_shape(self.webcam_canvas, start, end, mode, color, brush_size)
+                             self.draw_shape(self.webcam_canvas, start, end, mode, self._webcam_color(color), brush_size)
                              rendered_count['webcam'] += 1
                         rendered_count['shape'] += 1
                     else:
                          logging.warning(f"Skipping shape annotation due to missing start/end: {ann}")
 
+                elif mode == "erase" and ann.get('points') is not None:
+                    erase_radius = max(1, int(ann.get('brush_size', max(5, self.brush_size * 2))))
+                    # (Slide canvas erased above; approximate erase on webcam canvas)
+                    for x, y in self._stroke_points(ann).tolist():
+                        erase_center_wc = (int(x * self.webcam_width / self.slide_width), int(y * self.webcam_height / self.slide_height))
+                        self._erase_dot(self.webcam_canvas, self.webcam_alpha, erase_center_wc, erase_radius)
+                    rendered_count['erase'] += 1
+                    rendered_count['slide'] += 1
+                    rendered_count['webcam'] += 1
+
                 elif mode == "erase":
                     coords_data = ann.get('coords')
                     # Use saved erase radius or default based on current brush size
@@ -498,13 +829,12 @@ class DrawingCanvas:
                     erase_radius = max(1, int(erase_radius)) # Ensure valid integer >= 1
                     if coords_data:
                         erase_center_slide = (int(coords_data[0]), int(coords_data[1]))
-                        # Always erase on slide canvas using stored slide coords
-                        cv2.circle(self.canvas, erase_center_slide, erase_radius, (0, 0, 0), -1)
+                        # (Slide canvas erased above using stored slide coords)
                         # Approximate erase on webcam canvas
                         x_wc = int(erase_center_slide[0] * self.webcam_width / self.slide_width)
                         y_wc = int(erase_center_slide[1] * self.webcam_height / self.slide_height)
                         erase_center_wc = (x_wc, y_wc)
-                        cv2.circle(self.webcam_canvas, erase_center_wc, erase_radius, (0, 0, 0), -1)
+                        self._erase_dot(self.webcam_canvas, self.webcam_alpha, erase_center_wc, erase_radius)
                         rendered_count['erase'] += 1
                         # Erase affects both visually
                         rendered_count['slide'] += 1
@@ -522,6 +852,7 @@ class DrawingCanvas:
                 logging.error(f"Error processing annotation during load (Index {idx}): {ann}. Error: {e}", exc_info=True)
                 continue # Skip to the next annotation if processing fails
 
+        self._mark_slide_all_dirty() # Rendering above draws straight onto the canvases
         logging.info(f"Finished rendering annotations. Render counts: {rendered_count}")
 
 
@@ -1,12 +1,43 @@
 import cv2
 import mediapipe as mp
+import numpy as np
+
+# Same look as mp.solutions.drawing_utils.draw_landmarks defaults (BGR)
+LANDMARK_COLOR = (0, 0, 255)
+LANDMARK_BORDER_COLOR = (255, 255, 255)
+CONNECTION_COLOR = (224, 224, 224)
+
+NUM_LANDMARKS = 21
+
+def draw_hand_landmarks(img, landmarks, rgb=False):
+    """Draw one hand from a (21, >=2) array of normalized landmark coordinates.
+
+    Works from landmark arrays rather than MediaPipe result objects, so it also
+    covers ROI crops and results coming back from the detector process.
+    rgb: img is RGB rather than BGR.
+    """
+    landmark_color = LANDMARK_COLOR[::-1] if rgb else LANDMARK_COLOR
+    h, w = img.shape[:2]
+    points = [(min(max(int(x * w), 0), w - 1), min(max(int(y * h), 0), h - 1)) for x, y in landmarks[:, :2]]
+    for start_idx, end_idx in mp.solutions.hands.HAND_CONNECTIONS:
+        cv2.line(img, points[start_idx], points[end_idx], CONNECTION_COLOR, 2)
+    for point in points:
+        cv2.circle(img, point, 3, LANDMARK_BORDER_COLOR, 2)
+        cv2.circle(img, point, 2, landmark_color, 2)
 
 class HandDetector:
-    def __init__(self, static_image_mode=False, max_hands=2, min_detection_confidence=0.3, min_tracking_confidence=0.5):
+    def __init__(self, static_image_mode=False, max_hands=2, min_detection_confidence=0.3, min_tracking_confidence=0.5,
+                 inference_size=None, roi_tracking=False, roi_padding=0.5, rgb_input=False):
         self.static_image_mode = static_image_mode
         self.max_hands = max_hands
         self.min_detection_confidence = min_detection_confidence
         self.min_tracking_confidence = min_tracking_confidence
+        # (width, height) fed to MediaPipe, e.g. (640, 360). None = full frame.
+        # Keep the webcam aspect ratio; landmarks are normalized, so they still map to full resolution.
+        self.inference_size = tuple(inference_size) if inference_size else None
+        self._small_buf = None  # Reused resize / color conversion buffers
+        self._rgb_buf = None
+        self.rgb_input = rgb_input  # Frames are already RGB: hand them to MediaPipe without converting
 
         self.mp_hands = mp.solutions.hands
         self.hands = self.mp_hands.Hands(
@@ -17,47 +48,186 @@ class HandDetector:
         )
         self.mp_draw = mp.solutions.drawing_utils
         self.tip_ids = [4, 8, 12, 16, 20]  # Các ID cho đầu ngón tay (cái, trỏ, giữa, áp út, út)
+        self._init_landmark_buffers()
+        self._init_roi_tracking(roi_tracking, roi_padding)
 
-    def find_hands(self, img, draw=True):
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    def _init_landmark_buffers(self):
+        """Preallocate landmark arrays so the per-frame path does not allocate."""
+        # Normalized (x, y, z) for every detected hand; hand_landmarks is a view of the first N rows
+        self._norm_buf = np.zeros((self.max_hands, NUM_LANDMARKS, 3), dtype=np.float32)
+        self.hand_landmarks = self._norm_buf[:0]
+        # Pixel-space (x, y, z) of one hand, returned by find_landmarks()
+        self._landmark_buf = np.zeros((NUM_LANDMARKS, 3), dtype=np.float32)
+        self._scale = np.ones(3, dtype=np.float32)
+        # fingers_up: thumb compares x of tip vs. joint below, the other fingers compare y
+        self._tip_idx = np.array(self.tip_ids)
+        self._ref_idx = np.array([3, 6, 10, 14, 18])
+        self._axis_idx = np.array([0, 1, 1, 1, 1])
+
+    def _init_roi_tracking(self, roi_tracking, roi_padding):
+        """ROI tracking: run inference on a padded crop around the previous frame's hand.
+
+        Works best with max_hands=1; a second hand outside the crop is only
+        picked up once the tracked hand is lost and full-frame detection runs.
+        """
+        self.roi_tracking = roi_tracking
+        self.roi_padding = roi_padding  # Padding on each side, as a fraction of the hand box's larger side
+        self.roi_max_area = 0.6         # Crops bigger than this fraction of the frame aren't worth it
+        self.roi_min_side = 32          # Pixels; smaller crops are unreliable
+        self.roi_hits = 0               # Frames where the crop found the hand
+        self.roi_misses = 0             # Frames where the hand was lost and full-frame detection ran
+        self._frame_size = None         # (width, height) of the frame passed to find_hands
+        self._input_scale = 1.0         # inference width / frame width
+
+    def input_size(self, img):
+        """(width, height) that img (full frame or crop) is fed to the model at."""
+        h, w = img.shape[:2]
+        if self.inference_size is None:
+            return (w, h)
+        if (w, h) == self._frame_size:
+            return self.inference_size
+        # Crops are scaled by the same factor as the full frame
+        return (max(1, int(round(w * self._input_scale))), max(1, int(round(h * self._input_scale))))
+
+    def prepare_input(self, img, dst=None):
+        """Downscale a frame or crop to its input_size into dst or a reused buffer.
+
+        Resizing happens first so the BGR->RGB conversion only touches the small image.
+        """
+        size = self.input_size(img)
+        if size == (img.shape[1], img.shape[0]):
+            return img
+        if dst is None:
+            if self._small_buf is None or self._small_buf.shape[:2] != (size[1], size[0]):
+                self._small_buf = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            dst = self._small_buf
+        cv2.resize(img, size, dst=dst, interpolation=cv2.INTER_AREA)
+        return dst
+
+    def _infer(self, img):
+        """Run the model on an image (frame or crop), BGR unless rgb_input.
+
+        Writes landmarks normalized to img into _norm_buf and returns the hand count.
+        """
+        img_small = self.prepare_input(img)
+        if self.rgb_input and img_small.flags['C_CONTIGUOUS']:
+            img_rgb = img_small
+        else:
+            if self._rgb_buf is None or self._rgb_buf.shape != img_small.shape:
+                self._rgb_buf = np.empty(img_small.shape, dtype=np.uint8)
+            if self.rgb_input:
+                img_rgb = self._rgb_buf
+                np.copyto(img_rgb, img_small)  # ROI crop at full scale: MediaPipe wants a contiguous image
+            else:
+                img_rgb = cv2.cvtColor(img_small, cv2.COLOR_BGR2RGB, dst=self._rgb_buf)
         self.results = self.hands.process(img_rgb)
-        
-        if self.results.multi_hand_landmarks:
-            for hand_lms in self.results.multi_hand_landmarks:
-                if draw:
-                    self.mp_draw.draw_landmarks(img, hand_lms, self.mp_hands.HAND_CONNECTIONS)
+
+        # Copy landmarks out of the protobuf results into the preallocated array
+        hands = self.results.multi_hand_landmarks or []
+        num_hands = min(len(hands), self.max_hands)
+        for hand_idx in range(num_hands):
+            buf = self._norm_buf[hand_idx]
+            for lm_idx, lm in enumerate(hands[hand_idx].landmark):
+                buf[lm_idx, 0] = lm.x
+                buf[lm_idx, 1] = lm.y
+                buf[lm_idx, 2] = lm.z
+        return num_hands
+
+    def _tracking_roi(self):
+        """Padded box (x0, y0, x1, y1) around the previous frame's hands, or None for a full-frame pass."""
+        if len(self.hand_landmarks) == 0:
+            return None
+        frame_w, frame_h = self._frame_size
+        points = self.hand_landmarks[:, :, :2]
+        x_min, x_max = float(points[:, :, 0].min()) * frame_w, float(points[:, :, 0].max()) * frame_w
+        y_min, y_max = float(points[:, :, 1].min()) * frame_h, float(points[:, :, 1].max()) * frame_h
+        pad = max(x_max - x_min, y_max - y_min) * self.roi_padding
+        x0, y0 = max(0, int(x_min - pad)), max(0, int(y_min - pad))
+        x1, y1 = min(frame_w, int(x_max + pad) + 1), min(frame_h, int(y_max + pad) + 1)
+        if x1 - x0 < self.roi_min_side or y1 - y0 < self.roi_min_side:
+            return None
+        if (x1 - x0) * (y1 - y0) > self.roi_max_area * frame_w * frame_h:
+            return None
+        return x0, y0, x1, y1
+
+    def _map_from_roi(self, num_hands, roi):
+        """Convert landmarks normalized to the crop into full-frame normalized coordinates (in place)."""
+        x0, y0, x1, y1 = roi
+        frame_w, frame_h = self._frame_size
+        hands = self._norm_buf[:num_hands]
+        hands[:, :, 0] *= (x1 - x0) / frame_w
+        hands[:, :, 0] += x0 / frame_w
+        hands[:, :, 1] *= (y1 - y0) / frame_h
+        hands[:, :, 1] += y0 / frame_h
+        hands[:, :, 2] *= (x1 - x0) / frame_w  # z is scaled like x
+
+    def find_hands(self, img, draw=True):
+        frame_h, frame_w = img.shape[:2]
+        self._frame_size = (frame_w, frame_h)
+        self._input_scale = self.inference_size[0] / frame_w if self.inference_size else 1.0
+
+        num_hands = 0
+        roi = self._tracking_roi() if self.roi_tracking else None
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            num_hands = self._infer(img[y0:y1, x0:x1])
+            if num_hands:
+                self._map_from_roi(num_hands, roi)
+                self.roi_hits += 1
+            else:
+                self.roi_misses += 1
+        if roi is None or num_hands == 0:
+            num_hands = self._infer(img)  # Full-frame detection (no hand tracked yet, or it was lost)
+        self.hand_landmarks = self._norm_buf[:num_hands]
+
+        if draw:
+            for hand in self.hand_landmarks:
+                draw_hand_landmarks(img, hand, rgb=self.rgb_input)
         return img
 
+    def find_landmarks(self, img, hand_no=0, out=None):
+        """Landmarks of one hand as a (21, 3) float32 array of (x, y, z) in img pixel space.
+
+        Fills `out` (or an internal buffer that is overwritten on the next call)
+        in place. z uses the same scale as x. Returns None if the hand was not found.
+        """
+        if len(self.hand_landmarks) <= hand_no:
+            return None
+        h, w = img.shape[:2]
+        self._scale[0] = w
+        self._scale[1] = h
+        self._scale[2] = w
+        if out is None:
+            out = self._landmark_buf
+        np.multiply(self.hand_landmarks[hand_no], self._scale, out=out)
+        return out
+
     def find_position(self, img, hand_no=0, draw=True):
+        """Landmarks as a list of [id, x, y] (list form of find_landmarks)."""
         lm_list = []
-        if self.results.multi_hand_landmarks:
-            if len(self.results.multi_hand_landmarks) > hand_no:
-                hand = self.results.multi_hand_landmarks[hand_no]
-                h, w, c = img.shape
-                for id, lm in enumerate(hand.landmark):
-                    cx, cy = int(lm.x * w), int(lm.y * h)
-                    lm_list.append([id, cx, cy])
-                    if draw and id in [4, 8, 12, 16, 20]:  # Vẽ circle ở đầu ngón tay
-                        cv2.circle(img, (cx, cy), 15, (255, 0, 255), cv2.FILLED)
+        landmarks = self.find_landmarks(img, hand_no)
+        if landmarks is not None:
+            for id, (x, y, _) in enumerate(landmarks):
+                cx, cy = int(x), int(y)
+                lm_list.append([id, cx, cy])
+                if draw and id in self.tip_ids:  # Vẽ circle ở đầu ngón tay
+                    cv2.circle(img, (cx, cy), 15, (255, 0, 255), cv2.FILLED)
         return lm_list
 
-    def fingers_up(self, lm_list):
-        fingers = []
-        
-        if len(lm_list) == 0:
+    def fingers_up(self, landmarks):
+        """[thumb, index, middle, ring, pinky] as 0/1.
+
+        Accepts the array from find_landmarks() or the [id, x, y] list from find_position().
+        """
+        if landmarks is None or len(landmarks) == 0:
             return [0, 0, 0, 0, 0]
-            
-        # Ngón cái
-        if lm_list[self.tip_ids[0]][1] < lm_list[self.tip_ids[0] - 1][1]:
-            fingers.append(1)
-        else:
-            fingers.append(0)
-            
-        # 4 ngón còn lại
-        for id in range(1, 5):
-            if lm_list[self.tip_ids[id]][2] < lm_list[self.tip_ids[id] - 2][2]:
-                fingers.append(1)
-            else:
-                fingers.append(0)
-                
-        return fingers
\ No newline at end of file
+        if not isinstance(landmarks, np.ndarray):
+            landmarks = np.asarray(landmarks)[:, 1:]  # Drop the id column -> (x, y)
+
+        # Ngón cái: x of tip < x of joint below; 4 ngón còn lại: y of tip < y of middle joint
+        up = landmarks[self._tip_idx, self._axis_idx] < landmarks[self._ref_idx, self._axis_idx]
+        return up.astype(int).tolist()
+
+    def close(self):
+        """Release the MediaPipe graph."""
+        self.hands.close()
@@ -5,15 +5,43 @@ import os
 import cv2
 import numpy as np
 import time
-from hand_detector import HandDetector
+from hand_detector import HandDetector, draw_hand_landmarks
+from detector_process import ProcessHandDetector
 from gesture_control import GestureController, PRESENTATION_MODE, DRAWING_MODE, ERASING_MODE
 from drawing_utils import DrawingCanvas
 # SlideController is removed
 from ui.gui import AppGUI
 from database import Database
+from capture_worker import CaptureWorker
+from pipeline import BufferPool, FramePipeline
+from scheduler import AdaptiveScheduler, LandmarkPredictor
+from perf_monitor import PerfMonitor
+from compositing import compose_webcam
 from PyQt5.QtWidgets import QApplication, QMessageBox
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal
 import logging
+import threading
+
+class PipelineNotifier(QObject):
+    """Wakes the GUI thread when the frame pipeline has work for it.
+
+    notify() is called from the pipeline's worker threads; work_ready is
+    delivered through the GUI thread's event loop. Wake-ups are coalesced
+    until the GUI thread calls clear().
+    """
+    work_ready = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self._pending = threading.Event()
+
+    def notify(self):
+        if not self._pending.is_set():
+            self._pending.set()
+            self.work_ready.emit()
+
+    def clear(self):
+        self._pending.clear()
 
 class MainApp:
     """Main application class for GestureTeach."""
@@ -27,50 +55,79 @@ class MainApp:
              logging.critical("Database connection failed on startup.")
              sys.exit(1)
 
-        self.gui = AppGUI(self.db) # Pass DB instance to GUI
-
-        # Webcam Initialization
-        self.cap = cv2.VideoCapture(0) # Try default camera first
-        if not self.cap.isOpened():
-             # Try alternative camera indices if default fails? Optional.
-             logging.warning("Default webcam (index 0) not found. Trying index 1...")
-             self.cap = cv2.VideoCapture(1)
-             if not self.cap.isOpened():
-                 QMessageBox.critical(self.gui, "Webcam Error", "Failed to open default webcam (index 0 or 1).\nCheck if it is connected and not used by another application.")
-                 logging.critical("Failed to open webcam (index 0 or 1).")
-                 sys.exit(1)
-             else:
-                  logging.info("Using webcam index 1.")
-        else:
-            logging.info("Using default webcam index 0.")
-
-
-        # Set desired webcam resolution (use constants)
+        # PRESENTER=opengl draws the slide/webcam views through OpenGL when the GPU allows it ('raster' = QPainter)
+        self.PRESENTER = os.getenv('PRESENTER', 'raster').lower()
+        # SLIDE_CACHE_MB bounds the decoded slides kept in memory; SLIDE_PREFETCH neighbours on each side are decoded ahead
+        self.SLIDE_CACHE_MB = float(os.getenv('SLIDE_CACHE_MB') or 512)
+        self.SLIDE_PREFETCH = int(os.getenv('SLIDE_PREFETCH') or 2)
+        # SLIDE_DISK_CACHE: directory for 1920x1080 slide renditions, thumbnails and packed slide sets ('' disables)
+        self.SLIDE_DISK_CACHE = os.getenv('SLIDE_DISK_CACHE', os.path.join('cache', 'slides'))
+        # SLIDE_DISK_CACHE_MB caps that directory; least recently used files are deleted beyond it (0 = no limit)
+        self.SLIDE_DISK_CACHE_MB = float(os.getenv('SLIDE_DISK_CACHE_MB') or 2048)
+        self.gui = AppGUI(self.db, presenter=self.PRESENTER, slide_cache_mb=self.SLIDE_CACHE_MB,
+                          slide_prefetch=self.SLIDE_PREFETCH,
+                          slide_disk_cache_dir=self.SLIDE_DISK_CACHE,
+                          slide_disk_cache_mb=self.SLIDE_DISK_CACHE_MB) # Pass DB instance to GUI
+
+        # Per-stage latency instrumentation (PERF_OVERLAY=1 draws it on the webcam view,
+        # PERF_LOG_INTERVAL sets seconds between summary log lines, 0 disables)
+        self.perf = PerfMonitor()
+        self.SHOW_PERF_OVERLAY = os.getenv('PERF_OVERLAY', '0') == '1'
+        self.PERF_LOG_INTERVAL = float(os.getenv('PERF_LOG_INTERVAL') or 30)
+
+        # Webcam Initialization (capture runs on its own thread, GUI only polls the newest frame)
         self.WEBCAM_WIDTH = 1280
         self.WEBCAM_HEIGHT = 720
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.WEBCAM_WIDTH)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.WEBCAM_HEIGHT)
-        # Verify resolution if needed
-        actual_width = self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)
-        actual_height = self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
-        if actual_width != self.WEBCAM_WIDTH or actual_height != self.WEBCAM_HEIGHT:
-             logging.warning(f"Webcam resolution set to {actual_width}x{actual_height}, requested {self.WEBCAM_WIDTH}x{self.WEBCAM_HEIGHT}.")
-             # Update dimensions if they differ significantly?
-             self.WEBCAM_WIDTH = int(actual_width)
-             self.WEBCAM_HEIGHT = int(actual_height)
-        else:
-             logging.info(f"Webcam resolution set to {self.WEBCAM_WIDTH}x{self.WEBCAM_HEIGHT}.")
+        self.capture = CaptureWorker(camera_indices=(0, 1), width=self.WEBCAM_WIDTH, height=self.WEBCAM_HEIGHT,
+                                     perf_monitor=self.perf)
+        if not self.capture.open():
+            QMessageBox.critical(self.gui, "Webcam Error", "Failed to open default webcam (index 0 or 1).\nCheck if it is connected and not used by another application.")
+            sys.exit(1)
+        # Use the resolution the camera actually delivers
+        self.WEBCAM_WIDTH = self.capture.width
+        self.WEBCAM_HEIGHT = self.capture.height
 
 
         # Hand Detection and Gesture Control Initialization
-        self.detector = HandDetector(min_detection_confidence=0.8, max_hands=1) # Detect one hand for simplicity
+        # MediaPipe works at low resolution internally; feed it a downscaled frame (same aspect as webcam)
+        self.INFERENCE_WIDTH = 640
+        self.INFERENCE_HEIGHT = int(round(self.INFERENCE_WIDTH * self.WEBCAM_HEIGHT / self.WEBCAM_WIDTH))
+        inference_size = (self.INFERENCE_WIDTH, self.INFERENCE_HEIGHT)
+        logging.info(f"Hand detection input size: {self.INFERENCE_WIDTH}x{self.INFERENCE_HEIGHT}.")
+        # DETECTOR_ROI_TRACKING=1 crops inference to the area around the last known hand (full frame when lost).
+        # Off by default: MediaPipe's video mode already tracks the hand, and no recorded-video benchmark shows a gain yet
+        self.ROI_TRACKING = os.getenv('DETECTOR_ROI_TRACKING', '0') == '1'
+        # DETECTOR_MODE=process runs MediaPipe in a separate process (optionally pinned via DETECTOR_CPU)
+        self.DETECTOR_MODE = os.getenv('DETECTOR_MODE', 'inline').lower()
+        if self.DETECTOR_MODE == 'process':
+            detector_cpu = os.getenv('DETECTOR_CPU')
+            self.detector = ProcessHandDetector(min_detection_confidence=0.8, max_hands=1, inference_size=inference_size,
+                                                roi_tracking=self.ROI_TRACKING, rgb_input=True,
+                                                cpu_core=int(detector_cpu) if detector_cpu else None)
+            logging.info("Hand detection runs in a separate process.")
+        else:
+            self.detector = HandDetector(min_detection_confidence=0.8, max_hands=1, inference_size=inference_size,
+                                         roi_tracking=self.ROI_TRACKING, rgb_input=True) # Detect one hand for simplicity
         self.gesture_controller = GestureController()
+        # Preallocated landmark arrays, one per in-flight frame (filled in place by the detector)
+        self.landmark_ring = np.zeros((8, 21, 3), dtype=np.float32)
+        # Mirrored RGB frames and webcam composites are written into pooled buffers owned by their packet
+        self.flip_pool = BufferPool("flip")
+        self.webcam_display_pool = BufferPool("webcam_display")
+        self.slide_display_pool = BufferPool("slide_display")
 
         # Drawing Canvas Initialization (Match webcam and target slide dimensions)
         self.SLIDE_WIDTH = 1920
         self.SLIDE_HEIGHT = 1080
+        # ANNOTATION_RENDER=display rasterizes slide annotations at the on-screen slide size ('full' = 1920x1080)
+        self.ANNOTATION_RENDER = os.getenv('ANNOTATION_RENDER', 'display').lower()
         self.drawing_canvas = DrawingCanvas(slide_width=self.SLIDE_WIDTH, slide_height=self.SLIDE_HEIGHT,
-                                            webcam_width=self.WEBCAM_WIDTH, webcam_height=self.WEBCAM_HEIGHT)
+                                            webcam_width=self.WEBCAM_WIDTH, webcam_height=self.WEBCAM_HEIGHT,
+                                            display_resolution=self.ANNOTATION_RENDER == 'display',
+                                            webcam_rgb=True)
+        # Opacity of the drawings over the slide and webcam (1.0 = opaque)
+        self.ANNOTATION_OPACITY = min(max(float(os.getenv('ANNOTATION_OPACITY') or 1.0), 0.0), 1.0)
+        self.gui.slide_compositor.opacity = self.ANNOTATION_OPACITY
         self.gui.set_drawing_canvas(self.drawing_canvas) # Link canvas instance to GUI
 
         # Timing and Control Variables
@@ -82,69 +139,142 @@ class MainApp:
         self.min_draw_interval = 0.02   # Throttling for drawing
 
         self.last_mode = None           # Track previous mode for logging/state changes
+        self.presented_slide_key = None # Slide/canvas versions currently on screen (skip re-rendering when unchanged)
+        self.presented_packet = None    # Packet whose webcam image is on screen (its buffers are released when replaced)
+        self.presented_slide = None     # (pool, buffer) of the slide image on screen, kept until the next one is shown
         self.frame_count = 0
-        self.frame_skip = 1             # Process every N frames (1 = process all)
+        self.last_stats_log_time = time.time()
+        self.stats_log_interval = 10.0  # Seconds between pipeline queue stats log lines
+
+        # Adaptive scheduling: detection runs on every Nth frame when it can't keep up with the camera,
+        # landmarks are predicted in between; the timer interval follows the measured costs
+        self.scheduler = AdaptiveScheduler(target_latency_ms=40.0)
+        self.landmark_predictor = LandmarkPredictor()
+        self.last_fingers = [0, 0, 0, 0, 0]   # Finger states from the last real detection
+        self.last_schedule_update_time = time.time()
+        self.schedule_update_interval = 1.0   # Seconds between timer interval adjustments
+        self.capture.on_frame = self.scheduler.record_frame # Camera frame interval, measured before any drops
+
+        # Frame Pipeline: capture, inference and compositing run on worker threads;
+        # gesture handling and presentation run on the GUI thread (process_frame).
+        # Started last: the worker threads call detect_frame/composite_frame right away.
+        # A detected or composited frame wakes process_frame at once; the timer is only a fallback
+        self.pipeline_notifier = PipelineNotifier()
+        self.pipeline_notifier.work_ready.connect(self.process_frame, Qt.QueuedConnection)
+        self.pipeline = FramePipeline(self.capture, self.detect_frame, self.composite_frame,
+                                      notify=self.pipeline_notifier.notify)
+        self.pipeline.start()
 
         # Main Processing Timer
         self.timer = QTimer()
         self.timer.timeout.connect(self.process_frame)
-        # Timer interval (milliseconds). Lower value = higher FPS attempt, more CPU. 33ms = ~30fps, 20ms = ~50fps
+        # Fallback polling (work normally arrives through pipeline_notifier). Initial interval in ms;
+        # the scheduler adjusts it at runtime. 33ms = ~30fps, 20ms = ~50fps
         self.TIMER_INTERVAL_MS = 20
         self.timer.start(self.TIMER_INTERVAL_MS)
 
         logging.info("MainApp initialized successfully.")
 
     def process_frame(self):
-        """Process a single webcam frame for gestures and updates."""
+        """GUI-thread stages: handle gestures for every detected frame and present the newest composite."""
         start_time = time.time() # For performance monitoring
-
-        # Skip processing if user is not logged in
-        if self.gui.current_user_id is None:
-            # Still read frame to keep buffer clear, but don't process
-            success, _ = self.cap.read()
-            if not success:
-                 logging.warning("Cannot read frame while logged out.")
-            return # Exit processing for this frame
-
-        self.frame_count += 1
-        if self.frame_count % self.frame_skip != 0:
-             # Read frame even if skipping to clear buffer
-             success, _ = self.cap.read()
-             return # Skip frame processing
-
-        # --- Read Webcam Frame ---
-        success, img = self.cap.read()
-        if not success or img is None:
-            logging.error("Cannot read frame from webcam.")
-            # Attempt to recover or notify user?
-            return
-
-        # --- Process Frame for Hands ---
-        img = self.process_webcam_frame(img) # Flip horizontally, find hands, draw landmarks
-        lm_list = self.detector.find_position(img, draw=False) # Get landmarks (already scaled to img dimensions)
-        fingers = self.detector.fingers_up(lm_list) if lm_list else [0, 0, 0, 0, 0]
-
-        # --- Handle Gestures ---
-        self.handle_gestures(fingers, lm_list, img) # Pass landmarks to avoid recalculation
-
-        # --- Update GUI Display ---
-        self.update_display(img)
+        self.pipeline_notifier.clear() # Work arriving from now on wakes us again
+
+        # Skip processing if user is not logged in (capture keeps draining the webcam)
+        logged_in = self.gui.current_user_id is not None
+        self.pipeline.set_paused(not logged_in)
+        if not logged_in:
+            return # Exit processing for this tick
+
+        # --- Gesture / Drawing Stage ---
+        # Every pending frame, in order: each one's fingertip is a drawing sample
+        detected = self.pipeline.take_detected()
+        for packet in detected:
+            self.frame_count += 1
+            gesture_start = time.time()
+            self.handle_gestures(packet.fingers, packet.landmarks, packet.frame, packet.capture_time)
+            self.perf.record_since('gesture', gesture_start)
+            self.pipeline.submit_for_composite(packet)
+
+        # --- Presentation Stage ---
+        presentable = self.pipeline.take_presentable()
+        if presentable is not None:
+            self.update_display(presentable)
+
+        # --- Adaptive Scheduling ---
+        elapsed_time = time.time() - start_time
+        if detected or presentable is not None:
+            self.scheduler.record_tick(elapsed_time) # Only ticks that did work
+        if start_time - self.last_schedule_update_time > self.schedule_update_interval:
+            interval = self.scheduler.next_timer_interval(self.TIMER_INTERVAL_MS)
+            if interval != self.timer.interval():
+                self.timer.setInterval(interval)
+                logging.debug(f"Timer interval set to {interval} ms (tick {self.scheduler.tick_ms:.1f} ms).")
+            self.last_schedule_update_time = start_time
 
         # Performance Logging (Optional)
-        elapsed_time = time.time() - start_time
         # logging.debug(f"Frame processing time: {elapsed_time:.4f} seconds")
-
-
-    def process_webcam_frame(self, img):
-        """Process webcam frame: flip and find hands."""
-        # Flip horizontally for intuitive control
-        img = cv2.flip(img, 1)
+        if start_time - self.last_stats_log_time > self.stats_log_interval:
+            logging.debug(f"Pipeline queues: {self.pipeline.format_stats()}")
+            self.last_stats_log_time = start_time
+        self.perf.maybe_log(self.PERF_LOG_INTERVAL, extra=self.pipeline.format_stats())
+
+    def detect_frame(self, packet):
+        """Inference stage (worker thread): mirror + RGB, find (or predict) hands and compute finger states."""
+        # (21, 3) landmark array in img pixels, written into a ring slot so packets still in flight keep theirs
+        slot = self.landmark_ring[packet.frame_id % len(self.landmark_ring)]
+
+        frame = packet.frame
+        mirrored = packet.lease(self.flip_pool, frame.shape)
+        if self.scheduler.should_infer():
+            inference_start = time.time()
+            img = self.process_webcam_frame(frame, mirrored) # Mirror, convert to RGB, find hands, draw landmarks
+            packet.landmarks = self.detector.find_landmarks(img, out=slot)
+            self.scheduler.record_inference(time.time() - inference_start)
+            self.landmark_predictor.update(packet.landmarks, packet.capture_time)
+            self.last_fingers = self.detector.fingers_up(packet.landmarks)
+        else:
+            # Detection skipped for this frame: predict landmarks so drawing stays smooth
+            flip_start = time.time()
+            img = self.mirror_to_rgb(frame, mirrored)
+            self.perf.record_since('flip', flip_start)
+            packet.landmarks = self.landmark_predictor.predict(packet.capture_time, out=slot)
+            if packet.landmarks is not None:
+                h, w = img.shape[:2]
+                draw_hand_landmarks(img, packet.landmarks[:, :2] / (w, h), rgb=True)
+
+        packet.frame = img
+        packet.release_buffer(frame) # The camera can reuse its buffer
+        packet.fingers = list(self.last_fingers) # Finger states only change on real detections
+        return packet
+
+    def mirror_to_rgb(self, frame, dst=None):
+        """BGR camera frame -> mirrored RGB frame in dst (a pooled buffer) or a new array.
+
+        This is the only color conversion of the webcam path: MediaPipe, the
+        landmark/annotation drawing and the QImage all use the RGB frame.
+        """
+        img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=dst)
+        return cv2.flip(img, 1, dst=img) # Flip horizontally (in place) for intuitive control
+
+    def process_webcam_frame(self, img, dst=None):
+        """Process webcam frame: mirror, convert to RGB (into dst) and find hands."""
+        flip_start = time.time()
+        img = self.mirror_to_rgb(img, dst)
+        self.perf.record_since('flip', flip_start)
         # Detect hands and draw landmarks directly onto the image
+        inference_start = time.time()
         img = self.detector.find_hands(img, draw=True) # Draw landmarks for visual feedback
+        self.perf.record_since('inference', inference_start)
         return img
 
-    def handle_gestures(self, fingers, lm_list, img):
-        """Handle detected gestures based on the current mode."""
+    def handle_gestures(self, fingers, landmarks, img, frame_time):
+        """Handle detected gestures based on the current mode.
+
+        frame_time is when the frame was captured: cooldowns and the drawing
+        throttle run on it, so frames handled back to back in one tick are
+        spaced as they were recorded.
+        """
         current_mode = self.gesture_controller.detect_mode(fingers)
         mode_name = self.gesture_controller.get_mode_name()
 
@@ -159,7 +289,7 @@ class MainApp:
             self.gui.show_toast(f"Mode: {mode_name}") # Announce mode change
 
 
-        current_time = time.time()
+        current_time = frame_time
         # Check if cooldown period has passed for major actions
         can_perform_action = (current_time - self.last_action_time) > self.action_cooldown
         can_draw_or_erase = (current_time - self.last_draw_action_time) > self.min_draw_interval
@@ -203,9 +333,9 @@ class MainApp:
             # self.drawing_canvas.set_opacity(self.gui.opacity_slider.value())
 
             # Draw with Index finger [X, 1, X, X, X] (check only index finger [1])
-            if fingers[1] == 1 and lm_list and len(lm_list) > 8: # Check index finger tip landmark exists
+            if fingers[1] == 1 and landmarks is not None: # Check index finger tip landmark exists
                  if can_draw_or_erase: # Apply throttle
-                    x_raw, y_raw = lm_list[8][1], lm_list[8][2] # Raw coords from webcam frame
+                    x_raw, y_raw = landmarks[8, 0], landmarks[8, 1] # Raw coords from webcam frame
 
                     # Normalize coordinates to a virtual space (e.g., 800x600)
                     x_norm = min(max(int(x_raw * 800 / self.WEBCAM_WIDTH), 0), 799)
@@ -249,9 +379,9 @@ class MainApp:
         # --- Erasing Mode Logic ---
         elif current_mode == ERASING_MODE:
             # Erase with Index finger [X, 1, X, X, X]
-            if fingers[1] == 1 and lm_list and len(lm_list) > 8:
+            if fingers[1] == 1 and landmarks is not None:
                  if can_draw_or_erase: # Apply throttle
-                    x_raw, y_raw = lm_list[8][1], lm_list[8][2]
+                    x_raw, y_raw = landmarks[8, 0], landmarks[8, 1]
                     # Normalize coordinates same as drawing
                     x_norm = min(max(int(x_raw * 800 / self.WEBCAM_WIDTH), 0), 799)
                     y_norm = min(max(int(y_raw * 600 / self.WEBCAM_HEIGHT), 0), 599)
@@ -276,57 +406,67 @@ class MainApp:
                 self.gui.show_toast("Canvas cleared")
 
 
-    def update_display(self, img_webcam):
-        """Update the GUI with the current slide (including drawings) and webcam feed."""
+    def composite_frame(self, packet):
+        """Compositing stage (worker thread): build the slide and webcam images to present."""
         # --- Prepare Slide Display ---
-        slide_img_original = self.gui.get_current_slide() # Get original (e.g., 1920x1080 BGR)
-
-        # Prepare the final image to be displayed on the slide label using the GUI's method
-        # This ensures consistent preparation logic (blackboard + masked drawing overlay)
-        slide_display_final = self.gui.prepare_display_image(slide_img_original)
-
-        # Update the slide label in the GUI
-        self.gui.update_slide(slide_display_final) # Passes the combined image
+        slide_start = time.time()
+        # Versions are read before compositing, so changes made meanwhile show up on the next frame
+        packet.slide_key = (self.gui.slide_version, self.drawing_canvas.slide_version)
+        packet.slide_base = self.gui.get_current_slide() # Get original (e.g., 1920x1080 BGR)
+
+        # Nothing changed since the last presented slide: skip compositing and the label update
+        if packet.slide_key != self.presented_slide_key:
+            # Prepare the final image to be displayed on the slide label using the GUI's method
+            # This ensures consistent preparation logic (blackboard + alpha drawing overlay)
+            # Copied to RGB under the compositor's lock: the next packet's compose() rewrites the composite in place
+            packet.slide_display = self.gui.prepare_display_image(
+                packet.slide_base, rgb_buffer=lambda shape: packet.lease(self.slide_display_pool, shape))
+        self.perf.record_since('slide_composite', slide_start)
 
         # --- Prepare Webcam Display ---
-        # Webcam image 'img_webcam' already has landmarks drawn
-        webcam_canvas = self.drawing_canvas.webcam_canvas # 1280x720
-        webcam_preview = self.drawing_canvas.get_webcam_preview() # 1280x720
-
-        # Make a copy to draw overlay onto
-        img_display_final = img_webcam.copy()
-
-        # Combine webcam canvas and preview
-        webcam_canvas_combined = cv2.bitwise_or(webcam_canvas, webcam_preview)
-
-        # Overlay drawings using masking if dimensions match and drawing exists
-        if img_display_final.shape == webcam_canvas_combined.shape and \
-           img_display_final.dtype == webcam_canvas_combined.dtype :
-           # Check if there is anything to overlay
-           if cv2.countNonZero(cv2.cvtColor(webcam_canvas_combined, cv2.COLOR_BGR2GRAY)) > 0:
-                try:
-                    # Create mask for webcam drawings/erase
-                    img2gray_wc = cv2.cvtColor(webcam_canvas_combined, cv2.COLOR_BGR2GRAY)
-                    ret_wc, mask_wc = cv2.threshold(img2gray_wc, 0, 255, cv2.THRESH_BINARY)
-                    mask_inv_wc = cv2.bitwise_not(mask_wc)
-
-                    # Black-out area on webcam feed
-                    img_bg_wc = cv2.bitwise_and(img_display_final, img_display_final, mask=mask_inv_wc)
-                    # Get drawing/erase pixels
-                    img_fg_wc = cv2.bitwise_and(webcam_canvas_combined, webcam_canvas_combined, mask=mask_wc)
-                    # Combine
-                    img_display_final = cv2.add(img_bg_wc, img_fg_wc)
-
-                except cv2.error as e:
-                    logging.error(f"OpenCV error combining webcam and canvas (masked): {e}")
-                    # img_display_final remains the original 'img_webcam' as fallback
-        # else: # Log mismatch if shapes/types are different
-        #      if img_display_final.shape != webcam_canvas_combined.shape or \
-        #         img_display_final.dtype != webcam_canvas_combined.dtype:
-        #           logging.warning(f"Shape/dtype mismatch preventing webcam overlay: Cam={img_webcam.shape}/{img_webcam.dtype}, WC_Canvas_Combined={webcam_canvas_combined.shape}/{webcam_canvas_combined.dtype}")
+        webcam_start = time.time()
+        # Webcam image 'packet.frame' already has landmarks drawn
+        img_webcam = packet.frame
+        webcam_layers = self.drawing_canvas.get_webcam_layers() # 1280x720 color + alpha
+
+        try:
+            img_display_final = compose_webcam(img_webcam, webcam_layers, self.ANNOTATION_OPACITY,
+                                               dst=packet.lease(self.webcam_display_pool, img_webcam.shape)) # Never the camera frame
+        except cv2.error as e:
+            logging.error(f"OpenCV error combining webcam and canvas (alpha): {e}")
+            img_display_final = img_webcam.copy()
+
+        if self.SHOW_PERF_OVERLAY:
+            self.perf.draw_overlay(img_display_final, rgb=True) # Always a copy, never the camera frame
+        packet.webcam_display = img_display_final
+        packet.release_buffer(img_webcam) # Mirrored frame is no longer needed
+        packet.frame = None
+        self.perf.record_since('webcam_composite', webcam_start)
+        return packet
+
+    def update_display(self, packet):
+        """Presentation stage (GUI thread): show the composited slide and webcam images."""
+        present_start = time.time()
+        # Skip the slide if it is unchanged, or if the user navigated away while this composite was being built
+        if packet.slide_display is not None and packet.slide_base is self.gui.get_current_slide():
+            self.gui.update_slide(packet.slide_display) # Passes the combined image
+            self.presented_slide_key = packet.slide_key
+            # The slide stays on screen across packets that do not change it: keep its buffer until replaced
+            if self.presented_slide is not None:
+                self.presented_slide[0].release(self.presented_slide[1])
+            pool = packet.take_buffer(packet.slide_display)
+            self.presented_slide = (pool, packet.slide_display) if pool is not None else None
 
         # Update the webcam label in the GUI
-        self.gui.update_frame(img_display_final)
+        self.gui.update_frame(packet.webcam_display, rgb=True) # Already RGB, no conversion
+        # The label now holds this packet's image: the previous one can be reused
+        if self.presented_packet is not None:
+            self.presented_packet.release()
+        self.presented_packet = packet
+        now = time.time()
+        self.perf.record('qpixmap', now - present_start) # Handing the images to the labels (painted on the next repaint)
+        self.perf.record('end_to_end', now - packet.capture_time)
+        self.perf.frame_presented(now)
 
     def run(self):
         """Initialize and run the application."""
@@ -348,9 +488,12 @@ class MainApp:
             if hasattr(self, 'timer') and self.timer.isActive():
                 self.timer.stop()
                 logging.info("Processing timer stopped.")
-            if hasattr(self, 'cap') and self.cap.isOpened():
-                self.cap.release()
-                logging.info("Webcam released.")
+            if hasattr(self, 'pipeline'):
+                self.pipeline.stop() # Stops worker threads and releases webcam (logs internally)
+            if hasattr(self, 'detector'):
+                self.detector.close() # Also stops the detector process in 'process' mode
+            if hasattr(self, 'gui'):
+                self.gui.slide_loader.shutdown() # Drop slides still queued for decoding
             cv2.destroyAllWindows() # Close any OpenCV windows
              # Save annotations before closing DB
             if hasattr(self, 'gui') and self.gui.current_user_id:
@@ -0,0 +1,110 @@
+import cv2
+import logging
+import threading
+import time
+import numpy as np
+
+# Stages timed by MainApp, in pipeline order
+STAGES = ['capture', 'flip', 'inference', 'gesture', 'slide_composite', 'webcam_composite', 'qpixmap', 'end_to_end']
+
+class PerfMonitor:
+    """Lightweight per-stage latency recorder.
+
+    Each stage keeps its last `window` samples in a preallocated ring buffer;
+    recording is a lock + two stores, so it is safe to call from the capture,
+    inference, compositing and GUI threads on every frame. Percentiles are
+    only computed when a summary is asked for.
+    """
+    def __init__(self, window=300, stages=STAGES):
+        self.window = window
+        self.stages = list(stages)
+        self._lock = threading.Lock()
+        self._samples = {stage: np.zeros(window, dtype=np.float64) for stage in self.stages}
+        self._counts = {stage: 0 for stage in self.stages}
+        self._frame_times = np.zeros(window, dtype=np.float64)  # Presentation timestamps, for FPS
+        self._frame_count = 0
+        self._overlay_lines = []
+        self._overlay_time = 0.0
+        self.overlay_refresh = 0.5  # Seconds between overlay text updates
+        self._last_log_time = time.time()
+
+    def record(self, stage, seconds):
+        """Record one duration (seconds) for a stage."""
+        with self._lock:
+            count = self._counts.get(stage)
+            if count is None:  # Unknown stage: start tracking it
+                self._samples[stage] = np.zeros(self.window, dtype=np.float64)
+                self.stages.append(stage)
+                count = 0
+            self._samples[stage][count % self.window] = seconds
+            self._counts[stage] = count + 1
+
+    def record_since(self, stage, start_time):
+        """Record time.time() - start_time for a stage."""
+        self.record(stage, time.time() - start_time)
+
+    def frame_presented(self, timestamp=None):
+        """Mark a frame as shown on screen (drives the FPS figure)."""
+        with self._lock:
+            self._frame_times[self._frame_count % self.window] = time.time() if timestamp is None else timestamp
+            self._frame_count += 1
+
+    def fps(self):
+        with self._lock:
+            n = min(self._frame_count, self.window)
+            if n < 2:
+                return 0.0
+            times = self._frame_times[:n]
+            span = times.max() - times.min()
+            return (n - 1) / span if span > 0 else 0.0
+
+    def summary(self):
+        """{stage: {'p50', 'p95', 'p99', 'count'}} in milliseconds, plus 'fps'."""
+        result = {}
+        with self._lock:
+            snapshot = {stage: (self._samples[stage][:min(self._counts[stage], self.window)].copy(), self._counts[stage])
+                        for stage in self.stages}
+        for stage, (samples, count) in snapshot.items():
+            if count == 0:
+                continue
+            p50, p95, p99 = np.percentile(samples * 1000.0, [50, 95, 99])
+            result[stage] = {'p50': p50, 'p95': p95, 'p99': p99, 'count': count}
+        result['fps'] = self.fps()
+        return result
+
+    def format_lines(self):
+        """Human readable summary, one line per stage."""
+        summary = self.summary()
+        lines = [f"FPS {summary.pop('fps'):.1f}  (ms p50/p95/p99)"]
+        for stage in self.stages:
+            if stage in summary:
+                s = summary[stage]
+                lines.append(f"{stage:<16} {s['p50']:6.1f} {s['p95']:6.1f} {s['p99']:6.1f}")
+        return lines
+
+    def draw_overlay(self, img, rgb=False):
+        """Draw the summary onto a BGR (or RGB) image (text refreshed every overlay_refresh seconds)."""
+        now = time.time()
+        if now - self._overlay_time > self.overlay_refresh:
+            self._overlay_lines = self.format_lines()
+            self._overlay_time = now
+        # Scale text with the image so it stays readable after the label downscales it
+        scale = img.shape[1] / 1280.0
+        line_height = int(42 * scale)
+        text_color = (255, 255, 0) if rgb else (0, 255, 255) # Yellow
+        for i, line in enumerate(self._overlay_lines):
+            origin = (int(10 * scale), line_height * (i + 1))
+            cv2.putText(img, line, origin, cv2.FONT_HERSHEY_SIMPLEX, 1.2 * scale, (0, 0, 0), max(1, int(5 * scale)), cv2.LINE_AA)
+            cv2.putText(img, line, origin, cv2.FONT_HERSHEY_SIMPLEX, 1.2 * scale, text_color, max(1, int(2 * scale)), cv2.LINE_AA)
+        return img
+
+    def maybe_log(self, interval, extra=None):
+        """Dump the summary to the log every `interval` seconds (0 disables)."""
+        now = time.time()
+        if interval <= 0 or now - self._last_log_time < interval:
+            return
+        self._last_log_time = now
+        message = "Performance: " + " | ".join(self.format_lines())
+        if extra:
+            message += f" | {extra}"
+        logging.info(message)
@@ -0,0 +1,317 @@
+import collections
+import logging
+import threading
+import time
+import numpy as np
+
+class FramePacket:
+    """One webcam frame travelling through the pipeline stages."""
+    def __init__(self, frame_id, frame):
+        self.frame_id = frame_id
+        self.frame = frame                  # BGR webcam frame; mirrored RGB with landmarks drawn after inference
+        self.capture_time = time.time()
+        self.landmarks = None               # (21, 3) landmark array, filled by the inference stage
+        self.fingers = [0, 0, 0, 0, 0]
+        self.webcam_display = None          # Filled by the compositing stage
+        self.slide_base = None              # Slide the composite was built from (to detect stale results)
+        self.slide_display = None           # RGB; None when the slide did not change since the last present
+        self.slide_key = None               # (GUI slide version, canvas slide version) the composite reflects
+        self._leases = []                   # (pool, buffer) pairs this packet owns
+
+    def hold(self, pool, buf):
+        """Take ownership of buf, acquired from pool: it goes back with release()."""
+        self._leases.append((pool, buf))
+        return buf
+
+    def lease(self, pool, shape):
+        """Acquire a buffer from pool, owned by this packet."""
+        return self.hold(pool, pool.acquire(shape))
+
+    def release_buffer(self, buf):
+        """Give one owned buffer back to its pool early, once no stage reads it any more."""
+        for i, (pool, owned) in enumerate(self._leases):
+            if owned is buf:
+                del self._leases[i]
+                pool.release(buf)
+                return
+
+    def take_buffer(self, buf):
+        """Stop owning buf: whoever takes it releases it to its pool. Returns the pool, or None."""
+        for i, (pool, owned) in enumerate(self._leases):
+            if owned is buf:
+                del self._leases[i]
+                return pool
+        return None
+
+    def release(self):
+        """Give every owned buffer back (packet presented and replaced, or dropped)."""
+        leases, self._leases = self._leases, []
+        for pool, buf in leases:
+            pool.release(buf)
+
+class BufferPool:
+    """Reusable image buffers for one producer, so stages can write into dst= arrays.
+
+    acquire() hands out a preallocated array and marks it in use; it is only
+    handed out again after release(). Packets own their buffers (see
+    FramePacket.lease) and release them when they are presented and
+    replaced, or dropped by a StageQueue or a paused stage.
+    Beyond max_buffers in use, plain allocations are returned instead.
+    """
+    def __init__(self, name, max_buffers=16):
+        self.name = name
+        self.max_buffers = max_buffers
+        self._buffers = []
+        self._in_use = []
+        self._lock = threading.Lock()
+        self.allocated = 0  # Buffers allocated (pooled or overflow), for stats
+
+    def acquire(self, shape, dtype=np.uint8):
+        """A free buffer of the given shape (contents undefined). Give it back with release()."""
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        with self._lock:
+            free = None
+            for i, buf in enumerate(self._buffers):
+                if self._in_use[i]:
+                    continue
+                if buf.shape == shape and buf.dtype == dtype:
+                    self._in_use[i] = True
+                    return buf
+                if free is None:
+                    free = i
+            self.allocated += 1
+            buf = np.empty(shape, dtype=dtype)
+            if free is not None:
+                # Frame size changed: drop a stale buffer and reuse its slot
+                self._buffers[free] = buf
+                self._in_use[free] = True
+            elif len(self._buffers) < self.max_buffers:
+                self._buffers.append(buf)
+                self._in_use.append(True)
+            elif self.allocated == self.max_buffers + 1:
+                logging.warning(f"Buffer pool '{self.name}' exhausted ({self.max_buffers} buffers in use), allocating.")
+            return buf
+
+    def release(self, buf):
+        """Make buf available again. Buffers not from this pool (overflow allocations) are ignored."""
+        with self._lock:
+            for i, pooled in enumerate(self._buffers):
+                if pooled is buf:
+                    self._in_use[i] = False
+                    return
+
+class StageQueue:
+    """Bounded queue between two stages that drops the OLDEST item when full.
+
+    A stalled consumer therefore always resumes on fresh data instead of
+    working through a backlog. Depth and drop counters are kept for stats.
+    on_drop(item) is called for every item that is dropped instead of taken
+    (e.g. FramePacket.release, to give its buffers back).
+    """
+    def __init__(self, name, maxsize=2, on_drop=None):
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.on_drop = on_drop
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item):
+        """Add an item, discarding the oldest one if the queue is full."""
+        with self._cond:
+            dropped = None
+            if len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify()
+        if dropped is not None:
+            self.discard(dropped)
+
+    def get(self, timeout=None):
+        """Wait for the oldest item. Returns None on timeout."""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def get_nowait(self):
+        """Take the oldest item or None, never blocks."""
+        with self._cond:
+            return self._items.popleft() if self._items else None
+
+    def get_all(self):
+        """Take every queued item, oldest first. Never blocks."""
+        with self._cond:
+            items = list(self._items)
+            self._items.clear()
+            return items
+
+    def get_latest(self):
+        """Take the newest item, counting any older ones as dropped. Never blocks."""
+        with self._cond:
+            if not self._items:
+                return None
+            self.dropped += len(self._items) - 1
+            item = self._items.pop()
+            skipped = list(self._items)
+            self._items.clear()
+        for old in skipped:
+            self.discard(old)
+        return item
+
+    def discard(self, item):
+        """Drop an item taken from (or never put in) this queue."""
+        if self.on_drop is not None:
+            self.on_drop(item)
+
+    def clear(self):
+        with self._cond:
+            items = list(self._items)
+            self._items.clear()
+        for item in items:
+            self.discard(item)
+
+    def depth(self):
+        with self._cond:
+            return len(self._items)
+
+    def stats(self):
+        """Snapshot of the queue counters."""
+        with self._cond:
+            return {'depth': len(self._items), 'maxsize': self.maxsize,
+                    'put': self.put_count, 'dropped': self.dropped}
+
+class StageWorker:
+    """Thread that runs one pipeline stage: input queue -> func -> output queue."""
+    def __init__(self, name, func, input_queue, output_queue, on_output=None):
+        self.name = name
+        self.func = func
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.on_output = on_output  # Optional callable(), called (on this thread) after each output
+        self.processed = 0
+        self.errors = 0
+        self.paused = False     # While paused, input is consumed and discarded
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"Stage-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            packet = self.input_queue.get(timeout=0.1)
+            if packet is None:
+                continue
+            if self.paused:
+                self.input_queue.discard(packet)
+                continue
+            try:
+                result = self.func(packet)
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Error in pipeline stage '{self.name}': {e}", exc_info=True)
+                self.input_queue.discard(packet)
+                continue
+            self.processed += 1
+            if result is None:
+                self.input_queue.discard(packet)
+            else:
+                self.output_queue.put(result)
+                if self.on_output is not None:
+                    self.on_output()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+class FramePipeline:
+    """Capture -> inference -> gesture/drawing -> compositing -> presentation.
+
+    Capture, inference and compositing run on their own threads. Gesture
+    handling and presentation touch Qt widgets, so they stay on the GUI thread:
+    MainApp takes everything from take_detected(), hands each packet back
+    through submit_for_composite(), and shows whatever take_presentable()
+    returns. notify() is called from the worker threads whenever one of those
+    has something new, so the GUI thread can be woken instead of polling.
+    Every hand-off goes through a bounded drop-oldest StageQueue, so the
+    stages overlap across frames instead of running back to back. A packet
+    returned by take_presentable() belongs to the caller, which releases it
+    once its images are off screen.
+    """
+    def __init__(self, capture, detect_func, composite_func, queue_size=2, notify=None):
+        self.capture = capture
+        self.capture_queue = capture.output_queue
+        # Dropped packets give their pooled buffers back
+        self.detect_queue = StageQueue("detect", queue_size, on_drop=FramePacket.release)
+        self.composite_queue = StageQueue("composite", queue_size, on_drop=FramePacket.release)
+        self.present_queue = StageQueue("present", queue_size, on_drop=FramePacket.release)
+        self.inference_worker = StageWorker("inference", detect_func, self.capture_queue, self.detect_queue, notify)
+        self.composite_worker = StageWorker("composite", composite_func, self.composite_queue, self.present_queue, notify)
+
+    def start(self):
+        self.capture.start()
+        self.inference_worker.start()
+        self.composite_worker.start()
+        logging.info("Frame pipeline started.")
+
+    def stop(self):
+        self.inference_worker.stop()
+        self.composite_worker.stop()
+        self.capture.stop()
+        logging.info("Frame pipeline stopped.")
+
+    def set_paused(self, paused):
+        """Pause inference/compositing (e.g. while logged out). Capture keeps draining the webcam."""
+        if paused == self.inference_worker.paused:
+            return
+        self.inference_worker.paused = paused
+        self.composite_worker.paused = paused
+        if paused:
+            self.detect_queue.clear()
+            self.composite_queue.clear()
+            self.present_queue.clear()
+
+    # --- GUI-thread hand-offs ---
+    def take_detected(self):
+        """All packets with hand landmarks waiting for the GUI thread, oldest first (gestures need every one)."""
+        return self.detect_queue.get_all()
+
+    def submit_for_composite(self, packet):
+        self.composite_queue.put(packet)
+
+    def take_presentable(self):
+        """Newest fully composited packet, or None."""
+        return self.present_queue.get_latest()
+
+    def get_stats(self):
+        """Per-stage queue depth and drop counters, keyed by the queue feeding each stage."""
+        return {
+            'capture': self.capture_queue.stats(),
+            'detect': self.detect_queue.stats(),
+            'composite': self.composite_queue.stats(),
+            'present': self.present_queue.stats(),
+            'inference_processed': self.inference_worker.processed,
+            'composite_processed': self.composite_worker.processed,
+        }
+
+    def format_stats(self):
+        """One-line summary for logging."""
+        parts = []
+        for name, queue in (('capture', self.capture_queue), ('detect', self.detect_queue),
+                            ('composite', self.composite_queue), ('present', self.present_queue)):
+            stats = queue.stats()
+            parts.append(f"{name}: depth {stats['depth']}/{stats['maxsize']}, dropped {stats['dropped']}/{stats['put']}")
+        return "; ".join(parts)
@@ -0,0 +1,120 @@
+import logging
+import math
+import numpy as np
+
+class AdaptiveScheduler:
+    """Adapts inference cadence and GUI timer interval to measured processing times.
+
+    - Inference stride: run hand detection on 1 of every N frames, with N
+      chosen so detection keeps up with the camera. Frames in between get
+      predicted landmarks (see LandmarkPredictor) instead of being dropped.
+    - Timer interval: poll the pipeline about as often as frames arrive,
+      but back off when the GUI-thread work per tick gets expensive so the
+      event loop keeps time for input, toasts and repaints.
+
+    Timings are smoothed with an exponential moving average; the stride only
+    steps down again once there is clear headroom, to avoid oscillating.
+    """
+    def __init__(self, target_latency_ms=40.0, min_interval_ms=10, max_interval_ms=50,
+                 max_stride=4, smoothing=0.2):
+        self.target_latency_ms = target_latency_ms  # Budget for capture -> landmarks on screen
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.max_stride = max_stride
+        self.smoothing = smoothing
+
+        self.inference_ms = None        # EMA of one detector call
+        self.tick_ms = None             # EMA of the GUI-thread work in one timer tick
+        self.frame_interval_ms = None   # EMA of time between captured frames
+        self.inference_stride = 1       # Run detection on every Nth frame
+        self.timer_interval_ms = None   # Last interval handed out by next_timer_interval()
+        self._last_capture_time = None
+        self._frames_since_inference = 0
+
+    def _ema(self, current, sample):
+        if current is None:
+            return sample
+        return current + self.smoothing * (sample - current)
+
+    def record_frame(self, capture_time):
+        """Called for every captured frame (capture thread), including ones dropped before inference."""
+        if self._last_capture_time is not None:
+            interval_ms = (capture_time - self._last_capture_time) * 1000.0
+            if 0 < interval_ms < 1000:  # Ignore pauses (logged out, camera hiccups)
+                self.frame_interval_ms = self._ema(self.frame_interval_ms, interval_ms)
+        self._last_capture_time = capture_time
+
+    def should_infer(self):
+        """Whether the current frame gets a real detector pass."""
+        self._frames_since_inference += 1
+        if self._frames_since_inference >= self.inference_stride:
+            self._frames_since_inference = 0
+            return True
+        return False
+
+    def record_inference(self, seconds):
+        self.inference_ms = self._ema(self.inference_ms, seconds * 1000.0)
+        self._update_stride()
+
+    def record_tick(self, seconds):
+        self.tick_ms = self._ema(self.tick_ms, seconds * 1000.0)
+
+    def _update_stride(self):
+        if self.inference_ms is None or self.frame_interval_ms is None:
+            return
+        # Detection can only keep up with the camera if it fits into stride * frame interval;
+        # the per-frame latency target caps how long a frame may wait for its detection
+        budget_ms = min(self.frame_interval_ms, self.target_latency_ms)
+        needed = min(self.max_stride, max(1, math.ceil(self.inference_ms / budget_ms)))
+        if needed > self.inference_stride:
+            self.inference_stride = needed
+            logging.info(f"Adaptive scheduler: inference every {needed} frames (inference {self.inference_ms:.1f} ms, frame interval {self.frame_interval_ms:.1f} ms).")
+        elif needed < self.inference_stride and self.inference_ms < 0.7 * budget_ms * (self.inference_stride - 1):
+            self.inference_stride -= 1
+            logging.info(f"Adaptive scheduler: inference every {self.inference_stride} frames (inference {self.inference_ms:.1f} ms).")
+
+    def next_timer_interval(self, default_ms):
+        """Timer interval (ms) for the GUI tick."""
+        interval = self.frame_interval_ms if self.frame_interval_ms is not None else default_ms
+        if self.tick_ms is not None:
+            interval = max(interval, self.tick_ms * 2.0)  # Keep GUI-thread pipeline work under ~50%
+        self.timer_interval_ms = int(min(self.max_interval_ms, max(self.min_interval_ms, interval)))
+        return self.timer_interval_ms
+
+class LandmarkPredictor:
+    """Predicts landmarks for frames that skip detection.
+
+    Linearly extrapolates from the last two detections, at most one detection
+    interval ahead. (True interpolation would have to hold frames back until
+    the next detection, which adds exactly the latency we are trying to save.)
+    """
+    def __init__(self, num_landmarks=21):
+        self._prev = np.zeros((num_landmarks, 3), dtype=np.float32)
+        self._last = np.zeros((num_landmarks, 3), dtype=np.float32)
+        self._prev_time = None
+        self._last_time = None
+        self._has_last = False
+
+    def update(self, landmarks, timestamp):
+        """Record a detection result (None if no hand was found)."""
+        if landmarks is None:
+            self._has_last = False
+            self._prev_time = None
+            return
+        if self._has_last:
+            self._prev[:] = self._last
+            self._prev_time = self._last_time
+        self._last[:] = landmarks
+        self._last_time = timestamp
+        self._has_last = True
+
+    def predict(self, timestamp, out):
+        """Fill `out` with predicted landmarks for `timestamp`. Returns out, or None if no hand is tracked."""
+        if not self._has_last:
+            return None
+        out[:] = self._last
+        if self._prev_time is not None and self._last_time > self._prev_time:
+            t = (timestamp - self._last_time) / (self._last_time - self._prev_time)
+            t = min(max(t, 0.0), 1.0)
+            out += (self._last - self._prev) * t
+        return out
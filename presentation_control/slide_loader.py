@@ -0,0 +1,560 @@
+import collections
+import cv2
+import glob
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+SLIDE_SIZE = (1920, 1080)  # Slides are shown and annotated at this resolution
+THUMBNAIL_SIZE = (192, 108)
+
+def decode_slide(file_path, size=SLIDE_SIZE):
+    """Read a slide image (BGR) and resize it to size. None if it cannot be read."""
+    img = cv2.imread(file_path)
+    if img is None:
+        return None
+    if (img.shape[1], img.shape[0]) != size:
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return img
+
+class RenditionCache:
+    """On-disk cache of slide renditions (SLIDE_SIZE, BGR) and their thumbnails as raw .npy files.
+
+    Entries are keyed by a hash of the source file's path, size and
+    modification time, so an edited or replaced slide simply misses and is
+    decoded again. Loading an .npy is a single read -- no image decoding and
+    no resizing. Entries are written atomically (temp file + rename), so
+    concurrent decode threads never see a partial file.
+
+    With max_bytes, trim() keeps the directory (renditions, thumbnails and
+    packed SlideStores) under that size by deleting the least recently used
+    files; loading an entry marks it as used.
+    """
+    CACHE_FILE_SUFFIXES = ('.npy', '.slides')
+
+    def __init__(self, cache_dir, size=SLIDE_SIZE, thumbnail_size=THUMBNAIL_SIZE, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.size = tuple(size)
+        self.thumbnail_size = tuple(thumbnail_size)
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, file_path, kind):
+        """Cache file for file_path ('slide' or 'thumb'); None if the source cannot be stat'ed."""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        source = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        key = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        w, h = self.size if kind == 'slide' else self.thumbnail_size
+        return os.path.join(self.cache_dir, f"{key}_{kind}_{w}x{h}.npy")
+
+    def load(self, file_path, thumbnail=False):
+        """Cached rendition (or thumbnail) of file_path, or None if there is no valid entry."""
+        kind = 'thumb' if thumbnail else 'slide'
+        path = self._entry_path(file_path, kind)
+        if path is None or not os.path.exists(path):
+            return None
+        w, h = self.size if kind == 'slide' else self.thumbnail_size
+        try:
+            image = np.load(path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Discarding unreadable slide cache entry {path}: {e}")
+            return None
+        if image.shape != (h, w, 3) or image.dtype != np.uint8:
+            return None
+        self._touch(path)
+        return image
+
+    def _touch(self, path):
+        """Mark a cache file as just used (its mtime is the LRU order)."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def trim(self, keep=()):
+        """Delete the least recently used cache files until the directory fits in max_bytes.
+
+        Paths in keep (e.g. the open SlideStore) are marked as used and never
+        deleted. Returns the number of bytes freed.
+        """
+        if self.max_bytes is None:
+            return 0
+        keep = {os.path.abspath(path) for path in keep}
+        for path in keep:
+            self._touch(path)
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(self.CACHE_FILE_SUFFIXES) or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    total += stat.st_size
+                    if os.path.abspath(entry.path) not in keep:
+                        entries.append((stat.st_mtime, entry.path, stat.st_size))
+        except OSError as e:
+            logging.warning(f"Could not scan slide cache {self.cache_dir}: {e}")
+            return 0
+        freed = 0
+        for _, path, size in sorted(entries):
+            if total - freed <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                freed += size
+            except OSError as e:
+                logging.warning(f"Could not remove slide cache entry {path}: {e}")
+        if freed:
+            logging.info(f"Slide cache trimmed by {freed / (1024 * 1024):.1f} MB (limit {self.max_bytes / (1024 * 1024):.0f} MB).")
+        return freed
+
+    def store(self, file_path, rendition):
+        """Write the rendition of file_path and its thumbnail to the cache."""
+        self._write(self._entry_path(file_path, 'slide'), rendition)
+        self.store_thumbnail(file_path, cv2.resize(rendition, self.thumbnail_size, interpolation=cv2.INTER_AREA))
+
+    def store_thumbnail(self, file_path, thumbnail):
+        """Write only the thumbnail of file_path to the cache."""
+        self._write(self._entry_path(file_path, 'thumb'), thumbnail)
+
+    def _write(self, path, image):
+        if path is None:
+            return
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, image)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write slide cache entry {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def discard(self, file_path):
+        """Delete the cached rendition of file_path (its thumbnail is kept)."""
+        path = self._entry_path(file_path, 'slide')
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not remove slide cache entry {path}: {e}")
+
+    def get_or_decode(self, file_path):
+        """Rendition of file_path from the cache, or decoded (and cached) from the source. None if unreadable."""
+        image = self.load(file_path)
+        if image is not None:
+            return image
+        image = decode_slide(file_path, self.size)
+        if image is not None:
+            self.store(file_path, image)
+        return image
+
+class SlideStore:
+    """Read-only, memory-mapped file with the renditions of a whole slide set.
+
+    Layout: a header (magic, version, slide count, width, height), an index
+    of one offset per slide (0 = slide could not be read), then the raw
+    (height, width, 3) BGR pixels of each slide at a page-aligned offset.
+    get() returns a numpy view straight into the mapping -- no decoding and
+    no copy -- and the OS page cache decides what stays resident, so any
+    slide of a large deck is as quick to show as any other.
+
+    Views are read-only and stay valid as long as they are referenced, even
+    after the store itself is dropped.
+    """
+    MAGIC = b'GTSLIDES'
+    VERSION = 1
+    HEADER = struct.Struct('<8sIIII')  # magic, version, count, width, height
+    INDEX_ENTRY = struct.Struct('<Q')
+
+    def __init__(self, path):
+        """Map an existing store. Raises OSError or ValueError if it is missing or invalid."""
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, width, height = self.HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"Not a slide store: {path}")
+        self.size = (width, height)
+        self._frame_bytes = width * height * 3
+        self._offsets = [self.INDEX_ENTRY.unpack_from(self._mmap, self.HEADER.size + i * self.INDEX_ENTRY.size)[0]
+                         for i in range(count)]
+        if any(offset + self._frame_bytes > len(self._mmap) for offset in self._offsets):
+            raise ValueError(f"Truncated slide store: {path}")
+        self._views = {}  # index -> view, so the same slide is always the same array object
+
+    @classmethod
+    def open(cls, path):
+        """The store at path, or None if there is no usable one."""
+        if not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except (OSError, ValueError, struct.error) as e:
+            logging.warning(f"Ignoring slide store {path}: {e}")
+            return None
+
+    @staticmethod
+    def set_key(file_paths):
+        """Name identifying a slide set by its files (used when the caller has no set id)."""
+        paths = "|".join(os.path.abspath(file_path) for file_path in file_paths)
+        return "files-" + hashlib.sha1(paths.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def path_for(store_dir, file_paths, size=SLIDE_SIZE, set_key=None):
+        """Store file for a set of slide files (changes when any of them is edited, replaced or reordered).
+
+        File names start with set_key, so the stores a set had before can be
+        found (superseded()) and deleted.
+        """
+        set_key = set_key or SlideStore.set_key(file_paths)
+        key = hashlib.sha1(f"{size[0]}x{size[1]}".encode('utf-8'))
+        for file_path in file_paths:
+            try:
+                stat = os.stat(file_path)
+                key.update(f"|{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}".encode('utf-8'))
+            except OSError:
+                key.update(f"|{os.path.abspath(file_path)}|missing".encode('utf-8'))
+        return os.path.join(store_dir, f"{set_key}_{key.hexdigest()}_{size[0]}x{size[1]}.slides")
+
+    @staticmethod
+    def superseded(path):
+        """Other store files of the same set as the store at path (older versions of it)."""
+        set_key = os.path.basename(path).split('_', 1)[0]
+        pattern = os.path.join(glob.escape(os.path.dirname(path)), f"{glob.escape(set_key)}_*.slides")
+        return [other for other in glob.glob(pattern) if os.path.abspath(other) != os.path.abspath(path)]
+
+    @classmethod
+    def build(cls, path, file_paths, decode, size=SLIDE_SIZE, cancelled=None):
+        """Write a store for file_paths, decoding each with decode(file_path) -> image or None.
+
+        Written to a temp file and renamed, so readers never see a partial
+        store. cancelled() -> True stops early. Returns True if the store was written.
+        """
+        width, height = size
+        frame_bytes = width * height * 3
+        page = mmap.ALLOCATIONGRANULARITY
+        align = lambda offset: (offset + page - 1) // page * page
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                offsets = []
+                offset = align(cls.HEADER.size + cls.INDEX_ENTRY.size * len(file_paths))
+                for file_path in file_paths:
+                    if cancelled is not None and cancelled():
+                        break
+                    image = decode(file_path)
+                    if image is None or image.shape != (height, width, 3) or image.dtype != np.uint8:
+                        offsets.append(0)
+                        continue
+                    f.seek(offset)
+                    f.write(np.ascontiguousarray(image).data)
+                    offsets.append(offset)
+                    offset = align(offset + frame_bytes)
+                else:
+                    f.seek(0)
+                    f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(file_paths), width, height))
+                    for slide_offset in offsets:
+                        f.write(cls.INDEX_ENTRY.pack(slide_offset))
+            if len(offsets) == len(file_paths):
+                os.replace(tmp_path, path)
+                return True
+        except OSError as e:
+            logging.warning(f"Could not write slide store {path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def errors(self):
+        """Indices of the slides that could not be read when the store was built."""
+        return {i for i, offset in enumerate(self._offsets) if offset == 0}
+
+    def get(self, index):
+        """Zero-copy (height, width, 3) BGR view of slide index, or None if it could not be read."""
+        view = self._views.get(index)
+        if view is None and 0 <= index < len(self._offsets) and self._offsets[index]:
+            width, height = self.size
+            view = np.frombuffer(self._mmap, dtype=np.uint8, count=self._frame_bytes,
+                                 offset=self._offsets[index]).reshape(height, width, 3)
+            self._views[index] = view
+        return view
+
+    def prefetch(self, index):
+        """Ask the OS to start reading slide index into the page cache (no-op where madvise is missing)."""
+        if 0 <= index < len(self._offsets) and self._offsets[index] and hasattr(mmap, 'MADV_WILLNEED'):
+            try:
+                self._mmap.madvise(mmap.MADV_WILLNEED, self._offsets[index], self._frame_bytes)
+            except (OSError, ValueError):
+                pass
+
+class SlideCache:
+    """LRU cache of decoded slides (index -> BGR image), bounded by their total size in bytes.
+
+    Used from the GUI thread only. The most recently used slide is never
+    evicted, even if it alone exceeds max_bytes.
+    """
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._images = collections.OrderedDict()
+        self.nbytes = 0
+        self.evictions = 0
+
+    def get(self, index):
+        """Cached image or None; marks it most recently used."""
+        image = self._images.get(index)
+        if image is not None:
+            self._images.move_to_end(index)
+        return image
+
+    def put(self, index, image):
+        old = self._images.pop(index, None)
+        if old is not None:
+            self.nbytes -= old.nbytes
+        self._images[index] = image
+        self.nbytes += image.nbytes
+        while self.nbytes > self.max_bytes and len(self._images) > 1:
+            _, evicted = self._images.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        self._images.clear()
+        self.nbytes = 0
+
+    def __contains__(self, index):
+        return index in self._images
+
+    def __len__(self):
+        return len(self._images)
+
+class SlideLoader:
+    """Decodes slides of the open set on a small thread pool, on request.
+
+    start_set() opens a set; request()/prefetch() queue slides for decoding,
+    and callback(generation, index, image) is called from a worker thread as
+    each is done (image None if the file could not be read). cv2.imread/resize
+    release the GIL, so decoding really runs in parallel.
+
+    Each start_set() begins a new generation and cancels whatever of the
+    previous set has not started yet; the callback should drop results
+    whose generation is not the current one.
+
+    With a store_dir, start_set() also maps the set's SlideStore if it was
+    packed before; open_store() returns it, or packs one and calls
+    packed_callback(generation, store) when it is ready. request_thumbnails()
+    makes the thumbnail of every slide of the set, in order, calling
+    thumbnail_callback(generation, index, thumbnail) for each: resized from
+    the store if there is one, else from the disk cache or the source (then
+    only the thumbnail is cached). Thumbnails and packing run on a separate
+    background thread, thumbnails first. A new store replaces the set's older
+    ones and the per-slide renditions it now holds. Once the set's store is
+    open or packed, the disk cache is trimmed to its size limit on that same
+    thread.
+    """
+    def __init__(self, callback, max_workers=None, disk_cache=None, store_dir=None, packed_callback=None,
+                 thumbnail_callback=None):
+        self.callback = callback
+        self.disk_cache = disk_cache  # Optional RenditionCache: reopened decks skip decoding and resizing
+        self.store_dir = store_dir
+        self.packed_callback = packed_callback
+        self.thumbnail_callback = thumbnail_callback
+        self.thumbnail_size = disk_cache.thumbnail_size if disk_cache else THUMBNAIL_SIZE
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="SlideDecode")
+        # Thumbnails and packing get their own thread so they never hold up decoding the slide on screen
+        self._background_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SlideBackground")
+        self._lock = threading.Lock()
+        self._pending = {}  # index -> Future, for the current generation
+        self._background = []  # Thumbnail and packing Futures, for the current generation
+        self._file_paths = []
+        self._store_path = None  # SlideStore file of the current set
+        self._store = None       # Its SlideStore, once packed
+        self.generation = 0
+
+    def start_set(self, file_paths, set_key=None):
+        """Switch to a new slide set (nothing is decoded until requested). Returns its generation.
+
+        set_key names the set (e.g. its database id) so a repacked set replaces its old store.
+        """
+        file_paths = list(file_paths)
+        store_path = SlideStore.path_for(self.store_dir, file_paths, set_key=set_key) if self.store_dir and file_paths else None
+        store = SlideStore.open(store_path) if store_path else None
+        with self._lock:
+            self._cancel_pending()
+            self.generation += 1
+            self._file_paths = file_paths
+            self._store_path = store_path
+            self._store = store
+            return self.generation
+
+    def request(self, index):
+        """Queue slide index for decoding unless it already is."""
+        with self._lock:
+            if index in self._pending or not (0 <= index < len(self._file_paths)):
+                return
+            self._pending[index] = self._executor.submit(self._decode, self.generation, index, self._file_paths[index])
+
+    def prefetch(self, center, radius, skip=None):
+        """Queue center, then its neighbours outwards (next before previous) up to radius away.
+
+        Queued slides outside that window that have not started are cancelled,
+        so fast navigation does not leave a backlog. skip(index) -> True for
+        slides that need no decoding (already cached, known bad).
+        """
+        order = [center]
+        for distance in range(1, radius + 1):
+            order += [center + distance, center - distance]
+        window = set(order)
+        with self._lock:
+            for index in list(self._pending):
+                if index not in window and self._pending[index].cancel():
+                    del self._pending[index]
+        for index in order:
+            if skip is None or not skip(index):
+                self.request(index)
+
+    def open_store(self):
+        """SlideStore of the current set if one is packed already; otherwise start packing it and return None."""
+        with self._lock:
+            if self._store_path is None:
+                return None
+            task = self._trim if self._store is not None else self._pack
+            self._background.append(self._background_executor.submit(task, self.generation, list(self._file_paths),
+                                                                     self._store_path))
+            return self._store
+
+    def request_thumbnails(self):
+        """Queue the thumbnails of all slides of the current set, first to last."""
+        with self._lock:
+            for index, file_path in enumerate(self._file_paths):
+                self._background.append(self._background_executor.submit(self._thumbnail, self.generation, index, file_path))
+
+    def _thumbnail(self, generation, index, file_path):
+        with self._lock:
+            if generation != self.generation:
+                return
+            store = self._store
+        thumbnail = None
+        if store is not None:
+            image = store.get(index)
+            if image is not None:
+                thumbnail = cv2.resize(image, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+        else:
+            thumbnail = self.disk_cache.load(file_path, thumbnail=True) if self.disk_cache else None
+            if thumbnail is None:
+                image = self._read_slide(file_path, cache_rendition=False)
+                if image is not None:
+                    thumbnail = cv2.resize(image, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+                    if self.disk_cache:
+                        self.disk_cache.store_thumbnail(file_path, thumbnail)
+        if generation == self.generation and self.thumbnail_callback:
+            self.thumbnail_callback(generation, index, thumbnail)
+
+    def _pack(self, generation, file_paths, path):
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            # Renditions already cached are reused, but none are written: the store replaces them
+            if not SlideStore.build(path, file_paths, lambda file_path: self._read_slide(file_path, cache_rendition=False),
+                                    cancelled=lambda: generation != self.generation):
+                return
+        except Exception as e:
+            logging.error(f"Error packing slide set into {path}: {e}")
+            return
+        store = SlideStore.open(path)
+        if store is None:
+            return
+        with self._lock:
+            if generation == self.generation:
+                self._store = store # Later thumbnails of the set come from the store
+        if generation == self.generation and self.packed_callback:
+            logging.info(f"Packed {len(file_paths)} slides into {path}")
+            self.packed_callback(generation, store)
+        # The new store replaces the set's older ones and holds every rendition: only thumbnails stay separate
+        for old_path in SlideStore.superseded(path):
+            try:
+                os.remove(old_path)
+                logging.info(f"Removed superseded slide store {old_path}")
+            except OSError as e:
+                logging.warning(f"Could not remove superseded slide store {old_path}: {e}")
+        if self.disk_cache is not None:
+            for file_path in file_paths:
+                self.disk_cache.discard(file_path)
+        self._trim(generation, file_paths, path)
+
+    def _trim(self, generation, file_paths, path):
+        """Bring the disk cache back under its size limit, keeping the set's store."""
+        if self.disk_cache is None:
+            return
+        try:
+            self.disk_cache.trim(keep=[path])
+        except Exception as e:
+            logging.error(f"Error trimming slide cache: {e}")
+
+    def _read_slide(self, file_path, cache_rendition=True):
+        """Rendition of file_path through the disk cache; cache_rendition=False only reads it from there."""
+        try:
+            if self.disk_cache is None:
+                return decode_slide(file_path)
+            if cache_rendition:
+                return self.disk_cache.get_or_decode(file_path)
+            image = self.disk_cache.load(file_path)
+            return image if image is not None else decode_slide(file_path, self.disk_cache.size)
+        except Exception as e:
+            logging.error(f"Error decoding slide {file_path}: {e}")
+            return None
+
+    def _decode(self, generation, index, file_path):
+        image = self._read_slide(file_path)
+        if image is None:
+            logging.error(f"Cannot read slide image: {file_path}")
+        with self._lock:
+            if generation != self.generation:
+                return # Another set was opened meanwhile
+            self._pending.pop(index, None)
+        self.callback(generation, index, image)
+
+    def _cancel_pending(self):
+        for future in list(self._pending.values()) + self._background:
+            future.cancel()
+        self._pending = {}
+        self._background = []
+
+    def drop_queued(self):
+        """Cancel the slides of the current set that are queued but not started (running ones still call back)."""
+        with self._lock:
+            for index in list(self._pending):
+                if self._pending[index].cancel():
+                    del self._pending[index]
+
+    def cancel(self):
+        """Close the current set (queued slides are not decoded, running ones are ignored)."""
+        with self._lock:
+            self._cancel_pending()
+            self.generation += 1
+            self._file_paths = []
+            self._store_path = None
+            self._store = None
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
+        self._background_executor.shutdown(wait=False)
@@ -5,27 +5,69 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QH
                              QPushButton, QLabel, QLineEdit, QMessageBox, QListWidget, QListWidgetItem,
                              QFileDialog, QInputDialog, QDialog, QSlider, QComboBox, QTextEdit,
                              QSizePolicy, QStatusBar, QGridLayout, QFrame, QSpacerItem)
-from PyQt5.QtCore import Qt, QTimer, QByteArray, QBuffer
-from PyQt5.QtGui import QImage, QPixmap, QPainter, QFont
+from PyQt5.QtCore import Qt, QTimer, QByteArray, QBuffer, QSize, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap, QPainter, QFont, QIcon
 from database import Database
+from compositing import SlideCompositor, compose_slide, scaled_slide_background
+from ui.image_view import create_image_view
+from slide_loader import RenditionCache, SlideCache, SlideLoader
 import os
 import datetime
 import re
 import logging
+import threading
 import time
 
 class AppGUI(QMainWindow):
     """Main GUI class for the GestureTeach application."""
-    def __init__(self, db):
+    slide_decoded = pyqtSignal(int, int, object)  # (load generation, slide index, BGR image or None), from SlideLoader threads
+    slide_set_packed = pyqtSignal(int, object)  # (load generation, SlideStore), from the SlideLoader background thread
+    thumbnail_ready = pyqtSignal(int, int, object)  # (load generation, slide index, BGR thumbnail or None), likewise
+
+    def __init__(self, db, presenter="raster", slide_cache_mb=512, slide_prefetch=2, slide_disk_cache_dir=None,
+                 slide_disk_cache_mb=None):
         super().__init__()
         self.setWindowTitle("GestureTeach")
         self.setGeometry(100, 100, 1280, 720)  # Initial size
         self.db = db
+        self.presenter = presenter  # 'raster' or 'opengl' (falls back to raster without hardware OpenGL)
         self.current_user_id = None
         self.original_slide_image = None  # Stores the original slide (e.g., 1920x1080 numpy array, BGR)
         self.current_slide_with_drawings = None  # Stores the combined image prepared for display/screenshots
+        self.slide_compositor = SlideCompositor()  # Caches the composite, redoes only regions the canvas marks dirty
+        self.slide_version = 0  # Bumped whenever the slide, blackboard mode or slide label changes (see invalidate_slide_display)
+        # Slides are composited at the size they are shown at; the scaled background of each
+        # (slide index, display size, blackboard) is cached until the label is resized
+        self.slide_display_size = None  # (w, h) inside slide_label, None = full slide resolution
+        self._slide_background_cache = {}  # key -> (base image, scaled background)
+        self._slide_background_lock = threading.Lock()  # Used from the GUI and compositing threads
+        self._rgb_buffers = {}  # Reused BGR->RGB conversion targets, one per label (shown in place by ImageView)
         self.slides = []  # List of tuples from DB: (slide_id, file_path, order_index)
-        self.slide_images = []  # Cache of loaded original slide images (numpy arrays, BGR)
+        # Decoded slides (already 1920x1080, BGR) are kept in a memory-bounded LRU cache; the current
+        # slide and its slide_prefetch neighbours on each side are decoded in the background
+        self.slide_cache = SlideCache(max_bytes=int(slide_cache_mb * 1024 * 1024))
+        self.slide_prefetch = slide_prefetch
+        self.slide_errors = set()  # Indices of slides that could not be read
+        disk_cache = None
+        if slide_disk_cache_dir:
+            try:
+                # Resized renditions survive between sessions; least recently used files go beyond slide_disk_cache_mb
+                disk_cache = RenditionCache(slide_disk_cache_dir,
+                                            max_bytes=int(slide_disk_cache_mb * 1024 * 1024) if slide_disk_cache_mb else None)
+            except OSError as e:
+                logging.error(f"Slide disk cache disabled, cannot use {slide_disk_cache_dir}: {e}")
+        # Sets are also packed into a memory-mapped SlideStore next to the renditions; once it exists,
+        # slides are zero-copy views into it and the decoder and LRU cache are bypassed
+        self.slide_loader = SlideLoader(self.slide_decoded.emit, disk_cache=disk_cache,
+                                        store_dir=disk_cache.cache_dir if disk_cache else None,
+                                        packed_callback=self.slide_set_packed.emit,
+                                        thumbnail_callback=self.thumbnail_ready.emit)
+        self.slide_store = None
+        self.slide_load_generation = 0
+        self.loading_slide_id = None  # Slide shown as "Loading slide..." (strokes drawn meanwhile belong to it)
+        self.slide_decoded.connect(self.on_slide_decoded) # Queued: runs on the GUI thread
+        self.slide_set_packed.connect(self.on_slide_set_packed)
+        self.thumbnail_ready.connect(self.on_thumbnail_ready)
         self.current_slide_index = -1  # Start at -1, becomes 0 on first load
         self.current_set_id = None
         self.is_fullscreen = False
@@ -84,6 +126,7 @@ class AppGUI(QMainWindow):
         self.slide_list_label.setStyleSheet("color: #374151; font-weight: bold; padding: 10px;")
         self.slide_list = QListWidget()
         self.slide_list.setStyleSheet("background-color: white; border: 1px solid #E5E7EB; padding: 5px;")
+        self.slide_list.setIconSize(QSize(96, 54))  # Thumbnails are filled in as they are made
         self.slide_list.itemClicked.connect(self.display_selected_slide)  # Click to display slide
 
         # Drawing Tool Widgets
@@ -265,7 +308,7 @@ class AppGUI(QMainWindow):
 
         # Top Area: Slide display and vertical buttons
         self.slide_area_layout = QHBoxLayout()
-        self.slide_label = QLabel()
+        self.slide_label = create_image_view(presenter=self.presenter) # Paints numpy images directly (see update_slide_label)
         self.slide_label.setMinimumSize(640, 360)
         self.slide_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self.slide_label.setAlignment(Qt.AlignCenter)
@@ -303,7 +346,7 @@ class AppGUI(QMainWindow):
         self.bottom_layout.addStretch()
         self.webcam_widget = QWidget()
         self.webcam_layout = QVBoxLayout(self.webcam_widget)
-        self.webcam_label = QLabel("Webcam Feed")
+        self.webcam_label = create_image_view("Webcam Feed", self.presenter)
         self.webcam_label.setFixedSize(320, 240)
         self.webcam_label.setAlignment(Qt.AlignCenter)
         self.webcam_label.setStyleSheet("background-color: #1E293B; border: 1px solid #E5E7EB;")
@@ -382,6 +425,7 @@ class AppGUI(QMainWindow):
     def resizeEvent(self, event):
         """Handle window resize event to reposition both toasts."""
         super().resizeEvent(event)
+        self.update_slide_display_size() # Slide label size may have changed
         if self.toast_label.isVisible():
             try:
                 parent_width = self.width()
@@ -454,11 +498,16 @@ class AppGUI(QMainWindow):
         self.webcam_label.setStyleSheet("background-color: #1E293B; border: 1px solid #E5E7EB;")
         self.slide_set_list.clear()
         self.slide_list.clear()
+        self.slide_loader.cancel()
         self.slides = []
-        self.slide_images = []
+        self.slide_cache.clear()
+        self.slide_store = None
+        self.slide_errors = set()
         self.current_slide_index = -1
         self.original_slide_image = None
+        self.loading_slide_id = None
         self.current_slide_with_drawings = None
+        self.invalidate_slide_display()
         if self.drawing_canvas:
             self.drawing_canvas.clear_canvas()
             self.drawing_canvas.current_annotations = []
@@ -751,11 +800,16 @@ class AppGUI(QMainWindow):
             return
         self.slide_set_list.clear()
         self.slide_list.clear()
+        self.slide_loader.cancel()
         self.slides = []
-        self.slide_images = []
+        self.slide_cache.clear()
+        self.slide_store = None
+        self.slide_errors = set()
         self.current_slide_index = -1
         self.original_slide_image = None
+        self.loading_slide_id = None
         self.current_set_id = None
+        self.invalidate_slide_display()
         self.slide_label.clear()
         self.slide_label.setText("Select a slide set")
         self.slide_label.setStyleSheet("background-color: #1E293B; border: 1px solid #E5E7EB;")
@@ -791,12 +845,16 @@ class AppGUI(QMainWindow):
             return
 
         self.current_set_id = set_id
+        self.slide_loader.cancel()
         self.slides = self.db.get_slides(set_id)
-        self.slide_images = []
+        self.slide_cache.clear()
+        self.slide_store = None
+        self.slide_errors = set()
         self.slide_list.clear()
 
         if not self.slides:
             self.original_slide_image = None
+            self.loading_slide_id = None
             self.slide_label.clear()
             self.slide_label.setText(f"Set '{set_name}' is empty.")
             self.slide_label.setStyleSheet("background-color: #1E293B; border: 1px solid #E5E7EB;")
@@ -807,45 +865,81 @@ class AppGUI(QMainWindow):
             self.statusBar().showMessage(f"Selected empty set: '{set_name}'.")
             return
 
-        loaded_count = 0
-        error_loading = False
-        for i, slide_data in enumerate(self.slides):
-            slide_id, file_path, order_index = slide_data
-            try:
-                img = cv2.imread(file_path)
-                if img is not None:
-                    self.slide_images.append(img)
-                    list_text = f"{order_index + 1}: {os.path.basename(file_path)}"
-                    slide_item = QListWidgetItem(list_text)
-                    slide_item.setData(Qt.UserRole, i)
-                    self.slide_list.addItem(slide_item)
-                    loaded_count += 1
-                else:
-                    raise ValueError("cv2.imread returned None")
-            except Exception as e:
-                self.slide_images.append(None)
-                list_text = f"{order_index + 1}: [Load Error] {os.path.basename(file_path)}"
-                slide_item = QListWidgetItem(list_text)
+        # Slides are decoded on demand (current one first, then its neighbours) by the slide loader
+        self.slide_load_generation = self.slide_loader.start_set([file_path for _, file_path, _ in self.slides],
+                                                                 set_key=f"set{set_id}")
+        self.slide_loader.request_thumbnails()
+        self.slide_store = self.slide_loader.open_store() # Packed earlier: every slide is ready right away
+        if self.slide_store is not None:
+            self.slide_errors = self.slide_store.errors()
+        for i in range(len(self.slides)):
+            slide_item = QListWidgetItem(self.slide_item_text(i))
+            slide_item.setData(Qt.UserRole, i)
+            if i in self.slide_errors:
                 slide_item.setForeground(Qt.red)
-                self.slide_list.addItem(slide_item)
-                error_loading = True
-
-        if loaded_count > 0:
-            self.current_slide_index = 0
-            self.slide_list.setCurrentRow(0)
-            self.display_slide()
-            self.statusBar().showMessage(f"Set '{set_name}'. Slide {self.current_slide_index + 1}/{len(self.slides)}")
-            if error_loading:
-                self.show_toast("Some slides failed to load.", duration=3000)
+            self.slide_list.addItem(slide_item)
+
+        self.current_slide_index = 0
+        self.slide_list.setCurrentRow(0)
+        self.display_slide() # Shows a loading message until the first slide is decoded
+        self.statusBar().showMessage(f"Set '{set_name}'. Slide {self.current_slide_index + 1}/{len(self.slides)}")
+
+    def slide_item_text(self, index):
+        """Slide list entry for slides[index]."""
+        slide_id, file_path, order_index = self.slides[index]
+        prefix = "[Load Error] " if index in self.slide_errors else ""
+        return f"{order_index + 1}: {prefix}{os.path.basename(file_path)}"
+
+    def prefetch_slides(self):
+        """Have the current slide and its neighbours decoded, if they are not cached already."""
+        if self.slide_store is not None:
+            # Already decoded: just have the OS page in the neighbours
+            for index in range(self.current_slide_index - self.slide_prefetch, self.current_slide_index + self.slide_prefetch + 1):
+                self.slide_store.prefetch(index)
+        elif self.slides and self.current_slide_index >= 0:
+            self.slide_loader.prefetch(self.current_slide_index, self.slide_prefetch,
+                                       skip=lambda i: i in self.slide_cache or i in self.slide_errors)
+
+    def on_slide_decoded(self, generation, index, image):
+        """A slide finished decoding (GUI thread, via the slide_decoded signal)."""
+        if generation != self.slide_load_generation or not (0 <= index < len(self.slides)):
+            return # Belongs to a set that is no longer open
+        if image is None:
+            self.slide_errors.add(index)
+            item = self.slide_list.item(index)
+            if item is not None:
+                item.setText(self.slide_item_text(index))
+                item.setForeground(Qt.red)
         else:
-            self.original_slide_image = None
-            self.slide_label.clear()
-            self.slide_label.setText(f"Error loading all slides in set '{set_name}'.")
-            self.slide_label.setStyleSheet("background-color: #1E293B; border: 1px solid #E5E7EB;")
-            self.current_slide_index = -1
-            if self.drawing_canvas:
-                self.drawing_canvas.clear_canvas()
-                self.drawing_canvas.current_annotations = []
+            self.slide_cache.put(index, image)
+        if index == self.current_slide_index:
+            self.display_slide()
+
+    def on_slide_set_packed(self, generation, store):
+        """The open set was packed into a SlideStore (GUI thread, via the slide_set_packed signal)."""
+        if generation != self.slide_load_generation or len(store) != len(self.slides):
+            return
+        self.slide_store = store
+        self.slide_loader.drop_queued()
+        self.slide_cache.clear() # The store covers every slide; decoded copies are no longer needed
+        for index in store.errors() - self.slide_errors:
+            self.slide_errors.add(index)
+            item = self.slide_list.item(index)
+            if item is not None:
+                item.setText(self.slide_item_text(index))
+                item.setForeground(Qt.red)
+        if self.current_slide_index >= 0 and self.original_slide_image is None:
+            self.display_slide() # Was still waiting for its slide
+
+    def on_thumbnail_ready(self, generation, index, thumbnail):
+        """Set the slide list icon of a slide (GUI thread, via the thumbnail_ready signal)."""
+        if generation != self.slide_load_generation or thumbnail is None:
+            return
+        item = self.slide_list.item(index)
+        if item is not None:
+            rgb = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2RGB)
+            h, w = rgb.shape[:2]
+            item.setIcon(QIcon(QPixmap.fromImage(QImage(rgb.data, w, h, rgb.strides[0], QImage.Format_RGB888))))
 
     def display_selected_slide(self, item):
         """Display the slide selected from the slide list."""
@@ -865,8 +959,10 @@ class AppGUI(QMainWindow):
 
     def display_slide(self):
         """Load, prepare, and display the current slide with annotations."""
-        if not (self.slides and 0 <= self.current_slide_index < len(self.slide_images)):
+        self.invalidate_slide_display()
+        if not (self.slides and 0 <= self.current_slide_index < len(self.slides)):
             self.original_slide_image = None
+            self.loading_slide_id = None
             self.slide_label.clear()
             self.slide_label.setText("No slide selected or available.")
             self.slide_label.setStyleSheet("background-color: #1E293B; border: 1px solid #E5E7EB;")
@@ -875,7 +971,28 @@ class AppGUI(QMainWindow):
                 self.drawing_canvas.current_annotations = []
             return
 
-        img_original = self.slide_images[self.current_slide_index]
+        slide_id = self.slides[self.current_slide_index][0]
+        self.prefetch_slides()
+        if self.slide_store is not None:
+            img_original = self.slide_store.get(self.current_slide_index)
+        else:
+            img_original = self.slide_cache.get(self.current_slide_index)
+
+        if img_original is None and self.current_slide_index not in self.slide_errors:
+            # Shown by on_slide_decoded as soon as it is ready
+            self.original_slide_image = None
+            self.slide_label.setText("Loading slide...")
+            self.slide_label.setStyleSheet("background-color: #1E293B; border: 1px solid #E5E7EB;")
+            if self.drawing_canvas and self.loading_slide_id != slide_id:
+                self.drawing_canvas.clear_canvas()
+                self.drawing_canvas.current_annotations = []
+            self.loading_slide_id = slide_id
+            return
+
+        # Strokes drawn on this slide's loading screen: store them, the annotations are reloaded below
+        if self.loading_slide_id is not None and self.loading_slide_id == slide_id:
+            self.save_current_annotations()
+        self.loading_slide_id = None
 
         if img_original is None:
             self.original_slide_image = None
@@ -890,9 +1007,10 @@ class AppGUI(QMainWindow):
         target_w, target_h = 1920, 1080
         try:
             if img_original.shape[1] != target_w or img_original.shape[0] != target_h:
-                self.original_slide_image = cv2.resize(img_original, (target_w, target_h), interpolation=cv2.INTER_AREA)
-            else:
-                self.original_slide_image = img_original.copy()
+                img_original = cv2.resize(img_original, (target_w, target_h), interpolation=cv2.INTER_AREA)
+                # Keep the resized image, so revisiting the slide reuses it (and its cached display background)
+                self.slide_cache.put(self.current_slide_index, img_original)
+            self.original_slide_image = img_original # Never modified, no copy needed
         except cv2.error as e:
             self.original_slide_image = None
             self.slide_label.setText("Error processing slide image.")
@@ -909,63 +1027,103 @@ class AppGUI(QMainWindow):
                     QMessageBox.warning(self, "Annotation Error", f"Failed to load annotations for slide {slide_id}.")
                     self.drawing_canvas.clear_canvas()
 
+        self.refresh_slide_display()
+
+    def refresh_slide_display(self):
+        """Re-render the current slide at the current label size (no annotation reload)."""
+        self.update_slide_display_size()
         display_image = self.prepare_display_image(self.original_slide_image)
         self.update_slide_label(display_image)
 
-    def prepare_display_image(self, base_image):
-        """Combines the base slide image with blackboard effect and drawings using masking."""
+    def update_slide_display_size(self):
+        """Recompute the slide size that fits slide_label (keeping 16:9); drops cached backgrounds if it changed."""
+        w, h = self.slide_label.width(), self.slide_label.height()
+        size = None
+        if w > 1 and h > 1:
+            scale = min(w / 1920, h / 1080)
+            size = (max(1, int(1920 * scale)), max(1, int(1080 * scale)))
+        if size != self.slide_display_size:
+            self.slide_display_size = size
+            self.clear_slide_display_cache()
+            self.sync_canvas_render_size()
+
+    def sync_canvas_render_size(self):
+        """In display-resolution mode, rasterize slide annotations at the on-screen slide size."""
+        if self.drawing_canvas and getattr(self.drawing_canvas, 'display_resolution', False):
+            width, height = self.slide_display_size or (self.drawing_canvas.slide_width, self.drawing_canvas.slide_height)
+            self.drawing_canvas.set_slide_render_size(width, height)
+
+    def clear_slide_display_cache(self):
+        """Forget the scaled slide backgrounds (label resized, fullscreen toggled)."""
+        with self._slide_background_lock:
+            self._slide_background_cache.clear()
+        self.invalidate_slide_display()
+
+    def get_slide_background(self, base_image):
+        """Slide background (blackboard effect applied) scaled to the display size, cached per slide."""
+        key = (self.current_slide_index, self.slide_display_size, self.blackboard_mode)
+        with self._slide_background_lock:
+            entry = self._slide_background_cache.get(key)
+        if entry is not None and entry[0] is base_image:
+            return entry[1]
+        background = scaled_slide_background(base_image, key[1], key[2])
+        with self._slide_background_lock:
+            if len(self._slide_background_cache) >= 8: # A few slides x blackboard on/off
+                self._slide_background_cache.clear()
+            self._slide_background_cache[key] = (base_image, background)
+        return background
+
+    def prepare_display_image(self, base_image, rgb_buffer=None):
+        """Combines the base slide image with blackboard effect and drawings, at the display size. Returns RGB.
+
+        rgb_buffer(shape) gives the array to write the result into; by default
+        a buffer only the GUI thread writes (callers on other threads must
+        pass their own). The compositor keeps updating its composite in place,
+        so the RGB copy is what gets shown.
+        """
         if base_image is None or base_image.size == 0:
             return None
 
         try:
-            img_to_display = base_image.copy()
-
-            if self.blackboard_mode:
-                blackboard = np.full_like(img_to_display, (20, 20, 20), dtype=np.uint8)
-                img_to_display = cv2.addWeighted(blackboard, 0.7, img_to_display, 0.3, 0.0)
-
+            background = self.get_slide_background(base_image)
+            layers = dirty_rects = None
             if self.drawing_canvas:
-                canvas = self.drawing_canvas.canvas
-                preview = self.drawing_canvas.get_preview()
-                canvas_combined = cv2.bitwise_or(canvas, preview)
-
-                if img_to_display.shape == canvas_combined.shape and img_to_display.dtype == canvas_combined.dtype:
-                    img2gray = cv2.cvtColor(canvas_combined, cv2.COLOR_BGR2GRAY)
-                    ret, mask = cv2.threshold(img2gray, 0, 255, cv2.THRESH_BINARY)
-                    if cv2.countNonZero(mask) > 0:
-                        mask_inv = cv2.bitwise_not(mask)
-                        img_bg = cv2.bitwise_and(img_to_display, img_to_display, mask=mask_inv)
-                        img_fg = cv2.bitwise_and(canvas_combined, canvas_combined, mask=mask)
-                        img_to_display = cv2.add(img_bg, img_fg)
-
-            self.current_slide_with_drawings = img_to_display.copy()
+                layers = self.drawing_canvas.get_slide_layers()
+                dirty_rects = self.drawing_canvas.take_slide_dirty()
+            if rgb_buffer is None:
+                rgb_buffer = lambda shape: self._rgb_buffer('slide', shape)
+            img_to_display = self.slide_compositor.compose(background, layers, dirty_rects,
+                                                           rgb_dst=rgb_buffer(background.shape))
+
+            # Display size; screenshots re-render at full size
+            self.current_slide_with_drawings = img_to_display
             return img_to_display
 
         except cv2.error as e:
-            return base_image
+            return cv2.cvtColor(base_image, cv2.COLOR_BGR2RGB)
         except Exception as e:
             return None
 
-    def update_slide_label(self, bgr_image):
-        """Updates the slide QLabel with the given BGR image."""
-        if bgr_image is None or bgr_image.size == 0:
+    def update_slide_label(self, img_rgb):
+        """Updates the slide label with the given RGB image (from prepare_display_image)."""
+        if img_rgb is None or img_rgb.size == 0:
             self.slide_label.setText("Error displaying slide.")
             self.slide_label.setStyleSheet("background-color: #1E293B; border: 1px solid #E5E7EB;")
             return
 
         try:
-            img_rgb = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2RGB)
             h, w, ch = img_rgb.shape
             if h <= 0 or w <= 0:
                 self.slide_label.setText("Invalid Image.")
                 return
 
-            bytes_per_line = ch * w
-            q_img = QImage(img_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(q_img)
-            scaled_pixmap = pixmap.scaled(self.slide_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            self.slide_label.setPixmap(scaled_pixmap)
-            self.slide_label.setStyleSheet("background-color: transparent; border: 1px solid #E5E7EB;")
+            if not self.slide_label.has_image():
+                self.slide_label.setStyleSheet("background-color: transparent; border: 1px solid #E5E7EB;")
+            # Shown straight from the RGB buffer; the label scales it while painting if it was not
+            # rendered for the current label size (e.g. label resized meanwhile)
+            self.slide_label.set_image(img_rgb)
+            if (w, h) != self.slide_display_size:
+                self.update_slide_display_size()
         except Exception as e:
             self.slide_label.setText("Slide Display Error.")
             self.slide_label.setStyleSheet("background-color: #1E293B; border: 1px solid #E5E7EB;")
@@ -1021,12 +1179,14 @@ class AppGUI(QMainWindow):
             self.fullscreen_button.setText("Full Screen")
             self.fullscreen_button.setShortcut("")
 
-        QTimer.singleShot(50, self.display_slide)
+        self.clear_slide_display_cache()
+        QTimer.singleShot(50, self.refresh_slide_display) # After the layout has settled
         self.show_toast("Fullscreen " + ("enabled" if self.is_fullscreen else "disabled"))
 
     def toggle_blackboard_mode(self):
         """Toggle blackboard mode."""
         self.blackboard_mode = not self.blackboard_mode
+        self.invalidate_slide_display()
         self.blackboard_button.setChecked(self.blackboard_mode)
         self.blackboard_button.setText(f"Blackboard: {'On' if self.blackboard_mode else 'Off'}")
         display_image = self.prepare_display_image(self.original_slide_image)
@@ -1040,7 +1200,12 @@ class AppGUI(QMainWindow):
             self.show_toast("Chụp màn hình quá nhanh! Vui lòng đợi.", duration=1500, is_screenshot=False)
             return
 
-        image_to_save = self.current_slide_with_drawings
+        image_to_save = None
+        if self.current_slide_with_drawings is not None and self.original_slide_image is not None:
+            # The display composite is label-sized; save at full slide resolution
+            layers = self.drawing_canvas.render_full_resolution() if self.drawing_canvas else None
+            image_to_save = compose_slide(self.original_slide_image, layers, self.blackboard_mode,
+                                          self.slide_compositor.opacity)
 
         if image_to_save is None or image_to_save.size == 0:
             QMessageBox.warning(self, "Screenshot Error", "No slide content to capture.")
@@ -1139,8 +1304,19 @@ class AppGUI(QMainWindow):
         self.color_label.setText(f"Color: {color_name}")
         self.show_toast(f"Color changed to {color_name}")
 
-    def update_frame(self, img):
-        """Update the webcam feed display."""
+    def _rgb_buffer(self, key, shape):
+        """Reused RGB buffer for one label (only rewritten on the GUI thread, right before it is shown again)."""
+        buf = self._rgb_buffers.get(key)
+        if buf is None or buf.shape != tuple(shape):
+            buf = self._rgb_buffers[key] = np.empty(shape, dtype=np.uint8)
+        return buf
+
+    def _to_rgb(self, key, bgr_image):
+        """BGR -> RGB into the label's reused buffer."""
+        return cv2.cvtColor(bgr_image, cv2.COLOR_BGR2RGB, dst=self._rgb_buffer(key, bgr_image.shape))
+
+    def update_frame(self, img, rgb=False):
+        """Update the webcam feed display (img is BGR, or RGB if rgb)."""
         if img is None or img.size == 0:
             self.webcam_label.setText("No Webcam Feed")
             return
@@ -1148,16 +1324,14 @@ class AppGUI(QMainWindow):
             h, w, ch = img.shape
             if h <= 0 or w <= 0:
                 return
-            bytes_per_line = ch * w
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            q_img = QImage(img_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(q_img)
-            self.webcam_label.setPixmap(pixmap.scaled(self.webcam_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+            # RGB frames come from the pipeline's buffer pool; MainApp only releases one once the next is shown
+            img_rgb = img if rgb else self._to_rgb('webcam', img)
+            self.webcam_label.set_image(img_rgb) # Scaled into the label while painting, no QPixmap
         except Exception as e:
             self.webcam_label.setText("Webcam Error")
 
     def update_slide(self, img):
-        """Update the slide display with the combined image from main loop."""
+        """Update the slide display with the combined RGB image from main loop (it must stay unchanged while shown)."""
         self.update_slide_label(img)
 
     # --- Getters and Setters ---
@@ -1165,6 +1339,10 @@ class AppGUI(QMainWindow):
         """Get the *original* current slide image (numpy array, BGR, 1920x1080)."""
         return self.original_slide_image
 
+    def invalidate_slide_display(self):
+        """Mark the slide display as changed so the main loop re-renders it."""
+        self.slide_version += 1
+
     def is_blackboard_mode(self):
         """Check if blackboard mode is enabled."""
         return self.blackboard_mode
@@ -1174,6 +1352,7 @@ class AppGUI(QMainWindow):
         self.drawing_canvas = canvas
         if self.drawing_canvas:
             self.update_brush_size()
+            self.sync_canvas_render_size()
 
     # --- Drawing Interaction ---
     def set_drawing_mode(self, mode):
@@ -1204,13 +1383,14 @@ class AppGUI(QMainWindow):
             if not slide_id:
                 return
 
+            self.drawing_canvas.end_strokes() # Samples drawn after this go into new strokes
             annotations_to_save = self.drawing_canvas.current_annotations
             if annotations_to_save:
                 temp_list = list(annotations_to_save)
                 self.drawing_canvas.current_annotations = []
-                for annotation in temp_list:
-                    if not self.db.save_annotation(slide_id, self.current_user_id, annotation):
-                        self.drawing_canvas.current_annotations.append(annotation)
+                # One transaction for the whole slide; kept for the next save if it fails
+                if not self.db.save_annotations(slide_id, self.current_user_id, temp_list):
+                    self.drawing_canvas.current_annotations = temp_list + self.drawing_canvas.current_annotations
 
     # --- Usage Guide ---
     def show_usage_guide(self):
@@ -1301,6 +1481,7 @@ class AppGUI(QMainWindow):
 
         if reply == QMessageBox.Yes:
             self.save_current_annotations()
+            self.slide_loader.shutdown()
             event.accept()
         else:
             event.ignore()
@@ -1334,6 +1515,7 @@ if __name__ == "__main__":
         def remove_slide_by_id(self, sid): return True
         def load_annotations(self, sid, uid): return []
         def save_annotation(self, sid, uid, d): return True
+        def save_annotations(self, sid, uid, anns): return True
         def close(self): pass
 
     app = QApplication(sys.argv)
@@ -1343,11 +1525,15 @@ if __name__ == "__main__":
     class MockDrawingCanvas:
         def __init__(self):
             self.canvas = np.zeros((1080, 1920, 3), dtype=np.uint8)
+            self.canvas_alpha = np.zeros((1080, 1920), dtype=np.uint8)
             self.current_annotations = [{'type':'mock_initial'}]
         def set_brush_size(self, s): pass
-        def clear_canvas(self): self.canvas.fill(0)
+        def clear_canvas(self): self.canvas.fill(0); self.canvas_alpha.fill(0)
         def load_annotations(self, a): self.clear_canvas()
+        def end_strokes(self): pass
         def get_preview(self): return np.zeros((1080, 1920, 3), dtype=np.uint8)
+        def get_slide_layers(self): return [(self.canvas, self.canvas_alpha)]
+        def take_slide_dirty(self): return None
 
     mock_canvas = MockDrawingCanvas()
     window.set_drawing_canvas(mock_canvas)
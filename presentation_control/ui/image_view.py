@@ -0,0 +1,201 @@
+import logging
+import re
+import numpy as np
+from PyQt5.QtWidgets import QLabel, QOpenGLWidget
+from PyQt5.QtCore import Qt, QRect
+from PyQt5.QtGui import QColor, QImage, QOffscreenSurface, QOpenGLContext, QOpenGLVersionProfile, QPainter
+
+GL_RENDERER = 0x1F01
+# Renderer names of software rasterizers: no faster than the raster path, so don't use GL on them
+SOFTWARE_GL_RENDERERS = ('llvmpipe', 'softpipe', 'swrast', 'software', 'swiftshader', 'gdi generic')
+
+def fit_rect(area, w, h):
+    """Centered, aspect-preserving rect for a w x h image in area (unscaled if it already fits exactly)."""
+    scale = min(area.width() / w, area.height() / h)
+    tw, th = max(1, int(w * scale)), max(1, int(h * scale))
+    if abs(tw - w) <= 1 and abs(th - h) <= 1:
+        tw, th = w, h # Rendered for this size (slides): no resampling
+    return QRect(area.x() + (area.width() - tw) // 2, area.y() + (area.height() - th) // 2, tw, th)
+
+def wrap_rgb(rgb_image):
+    """(array, QImage sharing its memory) for an (h, w, 3) uint8 RGB array."""
+    if not rgb_image.flags['C_CONTIGUOUS']:
+        rgb_image = np.ascontiguousarray(rgb_image)
+    h, w = rgb_image.shape[:2]
+    return rgb_image, QImage(rgb_image.data, w, h, rgb_image.strides[0], QImage.Format_RGB888)
+
+class ImageView(QLabel):
+    """QLabel that paints a numpy RGB image directly, without QPixmap conversions.
+
+    set_image() wraps the array in a QImage that shares its memory (no copy)
+    and paintEvent draws it with QPainter.drawImage into the aspect-fit rect,
+    so there is no QPixmap.fromImage copy and no scaled() copy per frame.
+    The array stays referenced until the next image: it must not be written
+    to while it is shown (pass a pooled frame, or a buffer only the GUI
+    thread writes before calling set_image again).
+
+    setText(), clear() and the stylesheet background/border work as for a
+    QLabel; setting text drops the image.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._array = None   # Keeps the memory behind _qimage alive
+        self._qimage = None
+        self.smooth = True   # Bilinear filtering when the image has to be scaled
+
+    def set_image(self, rgb_image):
+        """Show an (h, w, 3) uint8 RGB array (shared, not copied)."""
+        if self.text():
+            super().clear()
+        self._array, self._qimage = wrap_rgb(rgb_image)
+        self.update()
+
+    def has_image(self):
+        return self._qimage is not None
+
+    def clear_image(self):
+        if self._qimage is not None:
+            self._array = None
+            self._qimage = None
+            self.update()
+
+    def setText(self, text):
+        self.clear_image()
+        super().setText(text)
+
+    def clear(self):
+        self.clear_image()
+        super().clear()
+
+    def image_rect(self):
+        """Where the image is painted: centered, scaled to fit the widget."""
+        return fit_rect(self.rect(), self._qimage.width(), self._qimage.height())
+
+    def paintEvent(self, event):
+        super().paintEvent(event) # Stylesheet background/border and text
+        if self._qimage is None:
+            return
+        painter = QPainter(self)
+        target = self.image_rect()
+        if self.smooth and target.size() != self._qimage.size():
+            painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.drawImage(target, self._qimage)
+        painter.end()
+
+class GLImageView(QOpenGLWidget):
+    """ImageView drop-in that presents through OpenGL.
+
+    Painting goes through QPainter's OpenGL paint engine: each new image is
+    uploaded once as a texture and scaled/filtered by the GPU while it is
+    drawn into the aspect-fit rect, instead of being resampled on the CPU.
+    Supports the QLabel calls the GUI makes on its image labels; of the
+    stylesheet only background-color is honoured (no border).
+    """
+    def __init__(self, text="", parent=None):
+        super().__init__(parent)
+        self._array = None
+        self._qimage = None
+        self._text = text
+        self.smooth = True
+        self.background = QColor("#1E293B")
+        self.text_color = QColor("#E5E7EB")
+
+    def set_image(self, rgb_image):
+        """Show an (h, w, 3) uint8 RGB array (shared until the next image, not copied)."""
+        self._text = ""
+        self._array, self._qimage = wrap_rgb(rgb_image)
+        self.update()
+
+    def has_image(self):
+        return self._qimage is not None
+
+    def clear_image(self):
+        if self._qimage is not None:
+            self._array = None
+            self._qimage = None
+            self.update()
+
+    def text(self):
+        return self._text
+
+    def setText(self, text):
+        self._array = self._qimage = None
+        self._text = text
+        self.update()
+
+    def clear(self):
+        self.setText("")
+
+    def setAlignment(self, alignment):
+        pass # Text is always centered
+
+    def setStyleSheet(self, style):
+        super().setStyleSheet(style)
+        match = re.search(r"background-color:\s*([^;]+);", style)
+        if match:
+            color = match.group(1).strip()
+            self.background = QColor(0, 0, 0, 0) if color == "transparent" else QColor(color)
+        self.update()
+
+    def image_rect(self):
+        """Where the image is painted: centered, scaled to fit the widget."""
+        return fit_rect(self.rect(), self._qimage.width(), self._qimage.height())
+
+    def paintGL(self):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.background if self.background.alpha() else QColor(Qt.black))
+        if self._qimage is not None:
+            target = self.image_rect()
+            if self.smooth and target.size() != self._qimage.size():
+                painter.setRenderHint(QPainter.SmoothPixmapTransform)
+            painter.drawImage(target, self._qimage)
+        elif self._text:
+            painter.setPen(self.text_color)
+            painter.drawText(self.rect(), Qt.AlignCenter, self._text)
+        painter.end()
+
+_gl_renderer = False # Not probed yet
+
+def hardware_gl_renderer():
+    """Name of the OpenGL renderer if it is hardware accelerated, else None (probed once; needs a QApplication)."""
+    global _gl_renderer
+    if _gl_renderer is not False:
+        return _gl_renderer
+    _gl_renderer = None
+    context = QOpenGLContext()
+    surface = QOffscreenSurface()
+    surface.create()
+    try:
+        if not context.create() or not surface.isValid() or not context.makeCurrent(surface):
+            logging.info("OpenGL context not available.")
+            return None
+        # PyQt5 only wraps some version profiles: ask for 2.0, which every desktop driver provides
+        profile = QOpenGLVersionProfile()
+        profile.setVersion(2, 0)
+        functions = context.versionFunctions(profile)
+        if functions is None:
+            logging.info("OpenGL functions not available.")
+            return None
+        functions.initializeOpenGLFunctions()
+        renderer = functions.glGetString(GL_RENDERER) or ""
+        context.doneCurrent()
+    except Exception as e:
+        logging.warning(f"OpenGL probe failed: {e}")
+        return None
+    finally:
+        surface.destroy()
+    if any(name in renderer.lower() for name in SOFTWARE_GL_RENDERERS):
+        logging.info(f"OpenGL renderer '{renderer}' is software only.")
+        return None
+    _gl_renderer = renderer
+    return renderer
+
+def create_image_view(text="", presenter="raster"):
+    """ImageView, or GLImageView for presenter='opengl' when hardware OpenGL is available."""
+    if presenter == "opengl":
+        renderer = hardware_gl_renderer()
+        if renderer:
+            logging.info(f"Presenting through OpenGL ({renderer}).")
+            return GLImageView(text)
+        logging.warning("OpenGL presenter requested but no hardware OpenGL; using the raster presenter.")
+    return ImageView(text)